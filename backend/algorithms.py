@@ -1,8 +1,10 @@
+import heapq
 import re
-from collections import Counter, defaultdict
+from collections import defaultdict
 from statistics import mean, median, mode
 from typing import List, Dict, Any, Optional
-from datetime import datetime
+import numpy as np
+from . import columnar
 
 def linear_search(transactions: List[Dict[str, Any]], keyword: str, fields: List[str]) -> List[Dict[str, Any]]:
     result = []
@@ -41,13 +43,26 @@ def timsort(transactions: List[Dict[str, Any]], field: str, reverse: bool = Fals
     """
     if not transactions:
         return []
+    return sorted(transactions, key=_none_safe_key(field, reverse), reverse=reverse)
 
+def _none_safe_key(field: str, reverse: bool):
     def key_func(t):
         val = t.get(field)
         none_marker = val is None
         return (none_marker, val) if not reverse else (not none_marker, val)
+    return key_func
 
-    return sorted(transactions, key=key_func, reverse=reverse)
+def top_k(transactions: List[Dict[str, Any]], field: str, k: int, reverse: bool = False) -> List[Dict[str, Any]]:
+    """``timsort(transactions, field, reverse)[:k]`` in O(n log k).
+
+    A bounded heap keeps the best *k* seen so far instead of sorting every
+    row; heapq's n-smallest/n-largest are stable, so None values and ties
+    land exactly where timsort puts them.
+    """
+    if k <= 0:
+        return []
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    return select(k, transactions, key=_none_safe_key(field, reverse))
 
 def quicksort(transactions: List[Dict[str, Any]], field: str) -> List[Dict[str, Any]]:
     if len(transactions) <= 1:
@@ -59,8 +74,9 @@ def quicksort(transactions: List[Dict[str, Any]], field: str) -> List[Dict[str,
 
 def compute_aggregates(transactions: List[Dict[str, Any]], field: str) -> Dict[str, Any]:
     values = [t.get(field) for t in transactions if t.get(field) is not None]
-    if not values:
-        return {"sum": 0, "mean": 0, "median": 0, "mode": None}
+    if all(isinstance(v, (int, float)) for v in values):
+        return columnar.aggregates(columnar.float_column(values))
+    # Non-numeric fields (e.g. dates) keep the statistics-module path
     agg = {
         "sum": sum(values),
         "mean": mean(values),
@@ -76,29 +92,15 @@ def compute_aggregates(transactions: List[Dict[str, Any]], field: str) -> Dict[s
     return agg
 
 def frequency_distribution(transactions: List[Dict[str, Any]], field: str) -> Dict[str, int]:
-    return dict(Counter(t.get(field, 'Unknown') for t in transactions))
+    codes, keys = columnar.encode(t.get(field, 'Unknown') for t in transactions)
+    counts = np.bincount(codes, minlength=len(keys))
+    return {k: int(c) for k, c in zip(keys, counts)}
 
 def monthly_aggregation(transactions: List[Dict[str, Any]], date_field: str, amount_field: str) -> Dict[str, float]:
-    monthly = defaultdict(float)
-    for t in transactions:
-        date_val = t.get(date_field)
-        amount = t.get(amount_field)
-        if date_val and amount is not None:
-            if isinstance(date_val, str):
-                try:
-                    date_val = datetime.fromisoformat(date_val)
-                except Exception:
-                    continue
-            key = date_val.strftime('%Y-%m')
-            monthly[key] += amount
-    return dict(monthly)
+    dates = columnar.date_column(t.get(date_field) for t in transactions)
+    amounts = columnar.float_column(t.get(amount_field) for t in transactions)
+    return columnar.monthly_totals(dates, amounts)
 
 def sliding_window_aggregation(monthly: Dict[str, float], window: int = 3) -> Dict[str, float]:
-   
-    keys = list(monthly.keys())
-    values = list(monthly.values())
-    result = {}
-    for i in range(len(values)):
-        window_vals = values[max(0, i-window+1):i+1]
-        result[keys[i]] = sum(window_vals) / len(window_vals)
-    return result 
\ No newline at end of file
+    averages = columnar.moving_average(columnar.float_column(monthly.values()), window)
+    return {k: float(v) for k, v in zip(monthly.keys(), averages)}
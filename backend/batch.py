@@ -0,0 +1,201 @@
+"""Batch ingestion of many receipts, uploaded as separate files or as ZIP archives.
+
+Files are counted, then stored and deduplicated, OCR and parsing fan out
+over the job process pool, and the results go to the group-commit writer,
+which stores them with bulk inserts in a few large transactions.  A batch
+takes at most OCR_WORKERS places in the jobs queue at a time, so single
+uploads are never stuck behind all of its files.
+"""
+import asyncio
+import os
+import time
+import zipfile
+from typing import Any, Dict, Iterable, List
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from .db import SessionLocal
+from .utils import ALLOWED_EXTENSIONS, FILE_TOO_LARGE, MAX_FILE_SIZE_BYTES, validate_file
+from .pipeline import run_extract, stored_ids
+from . import jobs, metrics, store, writer
+
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", 5000))
+
+
+def _failed(filename: str, detail: str) -> Dict[str, Any]:
+    return {"filename": filename, "status": "failed", "detail": detail}
+
+
+def _store(filename: str, ext: str, src) -> Dict[str, Any]:
+    # Archive headers can understate a member's size, so the limit is enforced
+    # on the bytes actually copied as well
+    try:
+        digest, path = store.ingest(src, ext, MAX_FILE_SIZE_BYTES)
+    except store.TooLarge:
+        return _failed(filename, FILE_TOO_LARGE)
+    return {"filename": filename, "ext": ext, "content_hash": digest, "path": path}
+
+
+def _zip_members(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    # Skip folders and the resource forks macOS adds to archives
+    return [info for info in archive.infolist() if not (info.is_dir() or info.filename.startswith("__MACOSX/"))]
+
+
+def _count_files(files: List[UploadFile]) -> int:
+    """Entries the batch will produce, read from the ZIP directories without extracting anything."""
+    total = 0
+    for file in files:
+        if os.path.splitext(file.filename)[1].lower() != ".zip":
+            total += 1
+            continue
+        try:
+            with zipfile.ZipFile(file.file) as archive:
+                total += len(_zip_members(archive))
+        except zipfile.BadZipFile:
+            total += 1
+        file.file.seek(0)
+    return total
+
+
+def _ingest_zip(file: UploadFile) -> List[Dict[str, Any]]:
+    try:
+        archive = zipfile.ZipFile(file.file)
+    except zipfile.BadZipFile:
+        return [_failed(file.filename, "Not a valid ZIP archive.")]
+    entries = []
+    with archive:
+        for info in _zip_members(archive):
+            name = info.filename
+            ext = os.path.splitext(name)[1].lower()
+            if ext not in ALLOWED_EXTENSIONS:
+                entries.append(_failed(name, f"Unsupported file type: {ext}"))
+            elif info.file_size > MAX_FILE_SIZE_BYTES:
+                entries.append(_failed(name, FILE_TOO_LARGE))
+            else:
+                with archive.open(info) as src:
+                    entries.append(_store(name, ext, src))
+    return entries
+
+
+def _ingest_upload(file: UploadFile) -> List[Dict[str, Any]]:
+    ext = os.path.splitext(file.filename)[1].lower()
+    if ext == ".zip":
+        return _ingest_zip(file)
+    try:
+        validate_file(file)
+    except HTTPException as e:
+        return [_failed(file.filename, str(e.detail))]
+    return [_store(file.filename, ext, file.file)]
+
+
+def _find_stored(hashes: Iterable[str]) -> Dict[str, Dict[str, int]]:
+    db = SessionLocal()
+    try:
+        return stored_ids(db, hashes)
+    finally:
+        db.close()
+
+
+async def _write(entry: Dict[str, Any]) -> None:
+    try:
+        result = await asyncio.wrap_future(
+            writer.submit(entry["filename"], entry["content_hash"], entry["parsed"], entry["line_items"]))
+    except Exception as e:
+        entry.update(status="failed", detail=f"Database error: {str(e)}")
+        return
+    # Another upload may have stored the same content meanwhile
+    status = "duplicate" if result.get("duplicate") else "stored"
+    entry.update(status=status, receipt_id=result["receipt_id"], transaction_id=result["transaction_id"])
+
+
+def _manifest_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: entry.get(k) for k in ("filename", "status", "content_hash", "receipt_id", "transaction_id")}
+    if entry["status"] == "failed":
+        out["detail"] = entry.get("detail")
+    if entry["status"] == "stored":
+        parsed = dict(entry["parsed"])
+        if parsed.get("date") and hasattr(parsed["date"], "isoformat"):
+            parsed["date"] = parsed["date"].isoformat()
+        out["extracted"] = parsed
+        out["line_items"] = len(entry["line_items"])
+    return out
+
+
+async def _extract_all(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """OCR and parse *entries* on the job pool, holding at most OCR_WORKERS queue places."""
+    if not entries:
+        return []
+    slots = jobs.reserve(min(jobs.OCR_WORKERS, len(entries)))
+    if not slots:
+        raise HTTPException(status_code=503, detail=jobs.QUEUE_FULL)
+    executor = jobs.get_executor()
+    in_flight = asyncio.Semaphore(slots)
+
+    async def extract(e: Dict[str, Any]) -> Dict[str, Any]:
+        async with in_flight:
+            return await asyncio.wrap_future(executor.submit(run_extract, e["path"], e["ext"], e["content_hash"]))
+
+    try:
+        return await asyncio.gather(*(extract(e) for e in entries))
+    finally:
+        jobs.release(slots)
+
+
+async def ingest_batch(files: List[UploadFile]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    # Both checks come before anything is written to the content store
+    if await run_in_threadpool(_count_files, files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {MAX_BATCH_FILES} files.")
+    if jobs.queue_full():
+        raise HTTPException(status_code=503, detail=jobs.QUEUE_FULL)
+    entries = []
+    for file in files:
+        entries.extend(await run_in_threadpool(_ingest_upload, file))
+
+    candidates = [e for e in entries if "content_hash" in e]
+    stored = await run_in_threadpool(_find_stored, {e["content_hash"] for e in candidates})
+    first_by_hash, to_process = {}, []
+    for e in candidates:
+        h = e["content_hash"]
+        if h in stored:
+            e.update(status="duplicate", **stored[h])
+        elif h in first_by_hash:
+            e["same_as"] = first_by_hash[h]
+        else:
+            first_by_hash[h] = e
+            to_process.append(e)
+            metrics.inc(metrics.CACHE_MISSES, cache="upload_dedup")
+            continue
+        metrics.inc(metrics.CACHE_HITS, cache="upload_dedup")
+
+    outcomes = await _extract_all(to_process)
+    ready = []
+    for e, outcome in zip(to_process, outcomes):
+        metrics.merge(outcome.pop("metrics", None))
+        if outcome["ok"]:
+            e.update(parsed=outcome["parsed"], line_items=outcome["line_items"])
+            ready.append(e)
+        else:
+            e.update(status="failed", detail=outcome["detail"])
+    await asyncio.gather(*(_write(e) for e in ready))
+
+    # Repeats of a file within the batch share the first copy's outcome
+    for e in candidates:
+        first = e.pop("same_as", None)
+        if first is not None:
+            if first["status"] == "failed":
+                e.update(status="failed", detail=first.get("detail"))
+            else:
+                e.update(status="duplicate", receipt_id=first.get("receipt_id"),
+                         transaction_id=first.get("transaction_id"))
+
+    elapsed = time.perf_counter() - started
+    results = [_manifest_entry(e) for e in entries]
+    return {
+        "total": len(results),
+        "stored": sum(1 for r in results if r["status"] == "stored"),
+        "duplicates": sum(1 for r in results if r["status"] == "duplicate"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "elapsed_s": round(elapsed, 3),
+        "files_per_second": round(len(results) / elapsed, 2) if elapsed > 0 else None,
+        "results": results,
+    }
@@ -0,0 +1,145 @@
+"""Array-backed column representation of transactions for vectorised analytics.
+
+Amounts are float64 (NaN when missing), dates datetime64[D] (NaT when
+missing), and vendor/category are dictionary-encoded int32 codes whose
+dictionaries keep first-appearance order, so grouped results come out in
+the same order the list-of-dicts code produced them.  A missing vendor or
+category is grouped under UNKNOWN, as in the rollup tables.
+"""
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Same key as rollups.UNKNOWN_KEY
+UNKNOWN = "Unknown"
+
+
+def encode(values: Iterable[Any]) -> Tuple[np.ndarray, List[Any]]:
+    """Dictionary-encodes *values*; the dictionary is in first-appearance order."""
+    lookup: Dict[Any, int] = {}
+    codes = [lookup.setdefault(v, len(lookup)) for v in values]
+    return np.asarray(codes, dtype=np.int32), list(lookup)
+
+
+def float_column(values: Iterable[Any]) -> np.ndarray:
+    # None -> NaN is done by NumPy's float conversion
+    return np.array(list(values), dtype=np.float64)
+
+
+def _to_day(value) -> Optional[date]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def date_column(values: Iterable[Any]) -> np.ndarray:
+    # NumPy converts date objects (and None -> NaT) in C; only odd inputs need _to_day
+    days = [v if type(v) is date else _to_day(v) for v in values]
+    return np.array(days, dtype="datetime64[D]")
+
+
+def aggregates(values: np.ndarray) -> Dict[str, Any]:
+    """sum/mean/median/mode of the non-NaN entries, matching algorithms.compute_aggregates."""
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return {"sum": 0, "mean": 0, "median": 0, "mode": None}
+    agg = {
+        "sum": float(values.sum()),
+        "mean": float(values.mean()),
+        "median": float(np.median(values)),
+        "mode": None,
+    }
+    if values.size > 1:
+        uniq, first_idx, counts = np.unique(values, return_index=True, return_counts=True)
+        # statistics.mode picks the first value seen among the most common ones
+        tied = counts == counts.max()
+        agg["mode"] = float(uniq[tied][np.argmin(first_idx[tied])])
+    return agg
+
+
+def group_sum(codes: np.ndarray, weights: np.ndarray, n_groups: int) -> np.ndarray:
+    return np.bincount(codes, weights=weights, minlength=n_groups)
+
+
+def monthly_totals(dates: np.ndarray, amounts: np.ndarray) -> Dict[str, float]:
+    """Sums amounts per YYYY-MM, keyed in order of each month's first appearance."""
+    mask = ~np.isnat(dates) & ~np.isnan(amounts)
+    if not mask.any():
+        return {}
+    months = dates[mask].astype("datetime64[M]")
+    uniq, first_idx, inverse = np.unique(months, return_index=True, return_inverse=True)
+    sums = group_sum(inverse.ravel(), amounts[mask], len(uniq))
+    order = np.argsort(first_idx, kind="stable")
+    return {str(uniq[i]): float(sums[i]) for i in order}
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over up to *window* values, O(n) via prefix sums."""
+    n = values.size
+    prefix = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    upper = np.arange(1, n + 1)
+    lower = np.maximum(0, upper - window)
+    return (prefix[upper] - prefix[lower]) / (upper - lower)
+
+
+def _or_unknown(value: Any) -> Any:
+    return UNKNOWN if value is None else value
+
+
+class TransactionColumns:
+    """Columns for a set of transactions."""
+
+    def __init__(self, amount: np.ndarray, date: np.ndarray,
+                 vendor_codes: np.ndarray, vendors: List[Any],
+                 category_codes: np.ndarray, categories: List[Any]):
+        self.amount = amount
+        self.date = date
+        self.vendor_codes = vendor_codes
+        self.vendors = vendors
+        self.category_codes = category_codes
+        self.categories = categories
+
+    def __len__(self) -> int:
+        return self.amount.size
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]]) -> "TransactionColumns":
+        vendor_codes, vendors = encode(_or_unknown(r.get("vendor")) for r in records)
+        category_codes, categories = encode(_or_unknown(r.get("category")) for r in records)
+        return cls(
+            amount=float_column(r.get("amount") for r in records),
+            date=date_column(r.get("date") for r in records),
+            vendor_codes=vendor_codes, vendors=vendors,
+            category_codes=category_codes, categories=categories,
+        )
+
+    def aggregates(self) -> Dict[str, Any]:
+        """aggregates() plus min, max and (population) stddev, as the rollup path reports them."""
+        agg = aggregates(self.amount)
+        values = self.amount[~np.isnan(self.amount)]
+        if values.size:
+            agg.update(min=float(values.min()), max=float(values.max()), stddev=float(values.std()))
+        else:
+            agg.update(min=None, max=None, stddev=None)
+        return agg
+
+    def amount_count(self) -> int:
+        return int(np.count_nonzero(~np.isnan(self.amount)))
+
+    def frequency(self, field: str) -> Dict[Any, int]:
+        codes, dictionary = (
+            (self.vendor_codes, self.vendors) if field == "vendor"
+            else (self.category_codes, self.categories)
+        )
+        counts = np.bincount(codes, minlength=len(dictionary))
+        return {key: int(c) for key, c in zip(dictionary, counts)}
+
+    def monthly_totals(self) -> Dict[str, float]:
+        return monthly_totals(self.date, self.amount)
@@ -1,11 +1,68 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, ForeignKey, Index
+from sqlalchemy import create_engine, event, select, Column, Integer, String, Float, Date, ForeignKey, Index, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 import os
+from . import metrics
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '../data/intellijanalyzer.db')
-engine = create_engine(f'sqlite:///{DB_PATH}', connect_args={"check_same_thread": False})
+DB_PATH = os.environ.get('RECEIPT_DB_PATH', os.path.join(os.path.dirname(__file__), '../data/intellijanalyzer.db'))
+
+# SQLite tuning, applied to every pooled connection as it is opened.  WAL lets
+# readers run alongside the writer and, with synchronous=NORMAL, a commit no
+# longer waits for an fsync (the last commits can be lost on power failure,
+# never corrupted).  Uploads are written by a single group-commit thread,
+# see writer.py.
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').upper()
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY').upper()
+SQLITE_BUSY_TIMEOUT_S = float(os.environ.get('SQLITE_BUSY_TIMEOUT_S', 30))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 8))
+
+for _name, _value, _allowed in [
+    ('SQLITE_JOURNAL_MODE', SQLITE_JOURNAL_MODE, {'WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF'}),
+    ('SQLITE_SYNCHRONOUS', SQLITE_SYNCHRONOUS, {'OFF', 'NORMAL', 'FULL', 'EXTRA'}),
+    ('SQLITE_TEMP_STORE', SQLITE_TEMP_STORE, {'DEFAULT', 'FILE', 'MEMORY'}),
+]:
+    if _value not in _allowed:
+        raise ValueError(f"{_name} must be one of {', '.join(sorted(_allowed))}, not {_value!r}")
+
+engine = create_engine(
+    f'sqlite:///{DB_PATH}',
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_S},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+)
+
+@event.listens_for(engine, "connect")
+def _configure_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA temp_store={SQLITE_TEMP_STORE}")
+    finally:
+        cursor.close()
+
+metrics.instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Read endpoints use the same file through aiosqlite, so a slow query holds a
+# pooled connection instead of one of the server's threadpool slots
+async_engine = create_async_engine(
+    f'sqlite+aiosqlite:///{DB_PATH}',
+    connect_args={"timeout": SQLITE_BUSY_TIMEOUT_S},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+)
+event.listen(async_engine.sync_engine, "connect", _configure_connection)
+metrics.instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class Receipt(Base):
@@ -13,6 +70,8 @@ class Receipt(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     upload_date = Column(Date, nullable=False)
+    # SHA-256 of the uploaded bytes; identical re-uploads resolve to this receipt
+    content_hash = Column(String(64), nullable=True, unique=True, index=True)
     transactions = relationship("Transaction", back_populates="receipt", cascade="all, delete-orphan")
 
 class Transaction(Base):
@@ -21,9 +80,12 @@ class Transaction(Base):
     receipt_id = Column(Integer, ForeignKey('receipts.id'), nullable=False, index=True)
     vendor = Column(String, index=True)
     date = Column(Date, index=True)
-    amount = Column(Float)
+    amount = Column(Float, index=True)
     category = Column(String, index=True)
     currency = Column(String, nullable=True)
+    # data_version of the commit that last inserted or changed the row; the
+    # change feed reads (version, id) ranges off its index
+    version = Column(Integer, index=True)
     receipt = relationship("Receipt", back_populates="transactions")
     line_items = relationship("LineItem", back_populates="transaction", cascade="all, delete-orphan")
 
@@ -35,9 +97,144 @@ class LineItem(Base):
     price = Column(Float, nullable=False)
     transaction = relationship("Transaction", back_populates="line_items")
 
+class AppMeta(Base):
+    """Small key/value table for schema-level bookkeeping."""
+    __tablename__ = 'app_meta'
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+
+# Counter bumped in the same commit as every change to transaction data
+# (uploads, recategorisation, rollup and index rebuilds).  Read endpoints use
+# it as their ETag, so a client holding the current version gets a 304
+# without the transactions table being read.  Rows written by the commit are
+# stamped with the new value in transactions.version.
+DATA_VERSION_KEY = 'data_version'
+DATA_VERSION_QUERY = select(AppMeta.value).where(AppMeta.key == DATA_VERSION_KEY)
+_BUMP_DATA_VERSION = text(
+    "INSERT INTO app_meta (key, value) VALUES (:key, '1') "
+    "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1 "
+    "RETURNING CAST(value AS INTEGER)"
+).bindparams(key=DATA_VERSION_KEY)
+
+def bump_data_version(db) -> int:
+    """Marks the data as changed and returns the new version.
+
+    Runs in, and commits with, the caller's transaction.  SQLite has one
+    writer at a time, so versions become visible in increasing order.
+    """
+    return db.execute(_BUMP_DATA_VERSION).scalar()
+
+def data_version(db) -> int:
+    value = db.execute(DATA_VERSION_QUERY).scalar()
+    return int(value) if value else 0
+
+class RollupColumns:
+    """Running summary of the transactions that fall into one group."""
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    amount_count = Column(Integer, nullable=False, default=0)
+    amount_sum = Column(Float, nullable=False, default=0.0)
+    amount_sumsq = Column(Float, nullable=False, default=0.0)
+    amount_min = Column(Float, nullable=True)
+    amount_max = Column(Float, nullable=True)
+
+class MonthlyRollup(RollupColumns, Base):
+    __tablename__ = 'rollup_monthly'
+
+class VendorRollup(RollupColumns, Base):
+    __tablename__ = 'rollup_vendor'
+
+class CategoryRollup(RollupColumns, Base):
+    __tablename__ = 'rollup_category'
+
+class RollupSketch(Base):
+    """sketches.TransactionSketch (JSON) of a month or category rollup group.
+
+    Kept apart from the summaries so their per-insert upserts stay small.
+    The sketch is current when *count* equals the group's count; otherwise
+    (or when missing) it is stale until rollups.refresh_sketches() runs.
+    """
+    __tablename__ = 'rollup_sketches'
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+    sketch = Column(String, nullable=False)
+
+# vendor, date, amount and category carry single-column indexes via index=True.
+# SQLite appends the rowid (id) to every index entry, so these also serve
+# keyset pagination and ORDER BY <column>, id without a separate sort.  The
+# sorted listing orders descending values with ties still by ascending id,
+# which needs the (column DESC, id) indexes below.
+Index('ix_transactions_date_desc', Transaction.date.desc(), Transaction.id)
+Index('ix_transactions_amount_desc', Transaction.amount.desc(), Transaction.id)
+
+
+Base.metadata.create_all(bind=engine, checkfirst=True)
+
+# create_all skips tables that already exist, so add the nullable columns and
+# the indexes introduced after a database was first created.
+def _add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl_type}'))
+
+_add_missing_columns()
+for _table in Base.metadata.sorted_tables:
+    for _index in _table.indexes:
+        _index.create(bind=engine, checkfirst=True)
+
+# Rows stored before the change feed existed predate every version
+with engine.begin() as _conn:
+    _conn.execute(text('UPDATE transactions SET version = 0 WHERE version IS NULL'))
 
-Index('ix_transactions_date', Transaction.date)
-Index('ix_transactions_vendor', Transaction.vendor)
+# Full-text index over vendor, category and line-item text, one row per
+# transaction (rowid = transactions.id).  Triggers keep it in step with every
+# insert, update and delete, whichever code path makes them.
+FTS_TABLE = 'transactions_fts'
+FTS_POPULATE_SQL = f"""
+INSERT INTO {FTS_TABLE}(rowid, vendor, category, items)
+SELECT t.id, t.vendor, t.category,
+       (SELECT group_concat(li.item, ' ') FROM line_items li WHERE li.transaction_id = t.id)
+FROM transactions t
+"""
+_FTS_ITEMS = "(SELECT group_concat(item, ' ') FROM line_items WHERE transaction_id = {ref})"
+_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(vendor, category, items, prefix='2 3')",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_ai AFTER INSERT ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, vendor, category, items)
+        VALUES (new.id, new.vendor, new.category, {_FTS_ITEMS.format(ref='new.id')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_au AFTER UPDATE OF vendor, category ON transactions BEGIN
+        UPDATE {FTS_TABLE} SET vendor = new.vendor, category = new.category WHERE rowid = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_ad AFTER DELETE ON transactions BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS line_items_fts_ai AFTER INSERT ON line_items BEGIN
+        UPDATE {FTS_TABLE} SET items = {_FTS_ITEMS.format(ref='new.transaction_id')} WHERE rowid = new.transaction_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS line_items_fts_au AFTER UPDATE OF item, transaction_id ON line_items BEGIN
+        UPDATE {FTS_TABLE} SET items = {_FTS_ITEMS.format(ref='old.transaction_id')} WHERE rowid = old.transaction_id;
+        UPDATE {FTS_TABLE} SET items = {_FTS_ITEMS.format(ref='new.transaction_id')} WHERE rowid = new.transaction_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS line_items_fts_ad AFTER DELETE ON line_items BEGIN
+        UPDATE {FTS_TABLE} SET items = {_FTS_ITEMS.format(ref='old.transaction_id')} WHERE rowid = old.transaction_id;
+    END""",
+]
 
+def _install_fulltext():
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        for ddl in _FTS_DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            conn.execute(text(FTS_POPULATE_SQL))
 
-Base.metadata.create_all(bind=engine, checkfirst=True) 
\ No newline at end of file
+_install_fulltext()
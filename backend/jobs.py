@@ -0,0 +1,194 @@
+"""Background OCR jobs on a bounded process pool.
+
+Uploads are persisted and queued here; OCR and parsing run in worker
+processes so the API event loop never waits on Tesseract, and the results are
+stored by the group-commit writer (writer.py).  Job state lives in memory in
+the API process.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from fastapi import HTTPException
+from .pipeline import run_extract
+from . import metrics, writer
+
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+MAX_PENDING_JOBS = int(os.environ.get("OCR_MAX_PENDING_JOBS", 64))
+# Finished jobs kept around for /jobs/{id}; the oldest are dropped first
+MAX_FINISHED_JOBS = int(os.environ.get("OCR_MAX_FINISHED_JOBS", 1000))
+
+_lock = threading.Lock()
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_pending = 0
+# content hash -> id of the queued/running job processing it
+_active_by_hash: Dict[str, str] = {}
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            # spawn keeps workers independent of the parent's threads and DB connections
+            _executor = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def shutdown() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _evict_finished() -> None:
+    finished = [jid for jid, j in _jobs.items() if j["status"] in ("done", "failed")]
+    for jid in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[jid]
+
+
+def _on_extracted(job_id: str, future) -> None:
+    try:
+        outcome = future.result()
+    except Exception as e:
+        outcome = {"ok": False, "status_code": 500, "detail": f"Worker failed: {str(e)}"}
+    metrics.merge(outcome.pop("metrics", None))
+    if not outcome["ok"]:
+        _finish(job_id, outcome)
+        return
+    with _lock:
+        job = _jobs.get(job_id)
+        filename, content_hash = job["filename"], job["content_hash"]
+    written = writer.submit(filename, content_hash, outcome["parsed"], outcome["line_items"])
+    written.add_done_callback(lambda f: _on_written(job_id, f))
+
+
+def _on_written(job_id: str, future) -> None:
+    try:
+        outcome = {"ok": True, "result": future.result()}
+    except Exception as e:
+        outcome = {"ok": False, "status_code": 500, "detail": f"Database error: {str(e)}"}
+    _finish(job_id, outcome)
+
+
+def _finish(job_id: str, outcome: Dict[str, Any]) -> None:
+    global _pending
+    with _lock:
+        _pending -= 1
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        if _active_by_hash.get(job.get("content_hash")) == job_id:
+            del _active_by_hash[job["content_hash"]]
+        job["finished_at"] = _now()
+        metrics.observe(metrics.STAGE_SECONDS, time.time() - job["submitted_ts"], stage="job_total")
+        if outcome["ok"]:
+            job["status"] = "done"
+            job["result"] = outcome["result"]
+        else:
+            job["status"] = "failed"
+            job["error"] = {"status_code": outcome["status_code"], "detail": outcome["detail"]}
+        job.pop("future", None)
+        _evict_finished()
+
+
+QUEUE_FULL = "Too many uploads are being processed, try again shortly."
+
+
+def queue_full() -> bool:
+    with _lock:
+        return _pending >= MAX_PENDING_JOBS
+
+
+def reserve(wanted: int) -> int:
+    """Claims up to *wanted* places in the pending queue for work submitted to
+    the pool directly (batch uploads); returns how many were claimed.
+    """
+    global _pending
+    with _lock:
+        claimed = max(0, min(wanted, MAX_PENDING_JOBS - _pending))
+        _pending += claimed
+        return claimed
+
+
+def release(count: int) -> None:
+    global _pending
+    with _lock:
+        _pending -= count
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def submit(job_id: str, path: str, filename: str, content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Queues a saved upload for processing.  Raises HTTPException(503) when the queue is full.
+
+    If the same content is already queued or running, that job is returned
+    instead of starting another one.
+    """
+    global _pending
+    executor = get_executor()
+    with _lock:
+        active = _jobs.get(_active_by_hash.get(content_hash))
+        if active is not None:
+            return public_view(active)
+        if _pending >= MAX_PENDING_JOBS:
+            raise HTTPException(status_code=503, detail=QUEUE_FULL)
+        _pending += 1
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "filename": filename,
+            "content_hash": content_hash,
+            "submitted_at": _now(),
+            "submitted_ts": time.time(),
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        _jobs[job_id] = job
+        if content_hash:
+            _active_by_hash[content_hash] = job_id
+    try:
+        ext = os.path.splitext(filename)[1].lower()
+        future = executor.submit(run_extract, path, ext, content_hash, job["submitted_ts"])
+    except Exception:
+        with _lock:
+            _pending -= 1
+            del _jobs[job_id]
+            _active_by_hash.pop(content_hash, None)
+        raise
+    with _lock:
+        if job["status"] == "queued":
+            job["future"] = future
+    future.add_done_callback(lambda f: _on_extracted(job_id, f))
+    return public_view(job)
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    view = {k: v for k, v in job.items() if k not in ("future", "result", "submitted_ts")}
+    future = job.get("future")
+    if future is not None and view["status"] == "queued" and future.running():
+        view["status"] = "running"
+    return view
+
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
@@ -1,44 +1,51 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import os
-from .utils import validate_file
-from .ocr import extract_text
-from .parser import parse_receipt_text, extract_line_items
-# fix missing import for category classification
-from .parser import extract_category
-from datetime import date
-from .db import SessionLocal, Receipt, Transaction, LineItem
+from .utils import FILE_TOO_LARGE, MAX_FILE_SIZE_BYTES, validate_file
+from .db import SessionLocal, AsyncSessionLocal, async_engine, Transaction, LineItem, DATA_VERSION_QUERY
 from typing import List, Optional
-from sqlalchemy import func
-from collections import Counter
-import statistics
-from datetime import datetime
-from .models import Transaction as TransactionModel, FileUploadModel
-from .algorithms import (
-    linear_search, hash_search, range_search, pattern_search,
-    timsort, quicksort, compute_aggregates, frequency_distribution,
-    monthly_aggregation, sliding_window_aggregation
+from sqlalchemy import select
+from .algorithms import sliding_window_aggregation
+from .columnar import TransactionColumns
+from . import export, jobs, metrics, recategorize, rollups, store, writer
+from .pipeline import existing_result
+from .batch import ingest_batch
+from .search import match_query, ranked_matches
+from .sketches import VENDOR_COUNTERS
+from .queries import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, CHANGES_PAGE_SIZE, MAX_CHANGES_PAGE_SIZE, TRANSACTION_COLUMNS,
+    apply_transaction_filters, keyset, split_page, row_to_dict,
+    parse_includes, line_items_query, group_line_items, sorted_parts,
+    parse_change_token, change_token, changes_query
 )
 
 app = FastAPI()
 
-# Fix categories for existing records on startup
+# Fix categories for existing records on startup.  The pass only runs when the
+# category rules changed and happens in the background, so it never delays
+# the server accepting traffic.
 @app.on_event("startup")
 def recategorize_existing():
     db = SessionLocal()
     try:
-        transactions = db.query(Transaction).all()
-        updated = False
-        for t in transactions:
-            new_cat = extract_category(t.vendor)
-            if new_cat != t.category:
-                t.category = new_cat
-                updated = True
-        if updated:
+        # Databases created before the rollup tables existed start out empty
+        if rollups.is_empty(db) and db.query(Transaction.id).first() is not None:
+            rollups.rebuild(db)
             db.commit()
     finally:
         db.close()
+    recategorize.start()
+
+@app.on_event("shutdown")
+def stop_workers():
+    jobs.shutdown()
+    writer.shutdown()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,113 +55,173 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = "../data/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Room for the multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+MAX_UPLOAD_BODY_BYTES = MAX_FILE_SIZE_BYTES + MULTIPART_OVERHEAD_BYTES
+
+
+class UploadSizeLimit:
+    """Caps the request body of a single-file upload.
+
+    A Content-Length over the limit is refused before the body is read.
+    Without one (chunked uploads), the body is counted as the form parser
+    reads it, and a 413 ends the request once it goes over, so at most the
+    limit is ever spooled to disk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != "/upload/":
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > MAX_UPLOAD_BODY_BYTES:
+            await JSONResponse(status_code=413, content={"detail": FILE_TOO_LARGE})(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_UPLOAD_BODY_BYTES:
+                    # Raised inside the form parsing, so FastAPI answers it like any HTTPException
+                    raise HTTPException(status_code=413, detail=FILE_TOO_LARGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+# Added before the metrics middleware so it runs inside it: an exception raised
+# from receive() must not cross a BaseHTTPMiddleware on its way to FastAPI
+app.add_middleware(UploadSizeLimit)
+
+if metrics.ENABLED:
+    @app.middleware("http")
+    async def time_requests(request: Request, call_next):
+        with metrics.timer(metrics.REQUEST_SECONDS, method=request.method, route="unmatched", status=500) as t:
+            response = await call_next(request)
+            # Label by route template, not raw path, to keep the series count bounded
+            route = request.scope.get("route")
+            if route is not None:
+                t.labels["route"] = route.path
+            t.labels["status"] = response.status_code
+        return response
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Stage, request and query latencies plus counters, in Prometheus text format."""
+    if not metrics.ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Metrics are disabled; set METRICS_ENABLED=1."})
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/upload/")
 async def upload_receipt(file: UploadFile = File(...)):
-  
-    try:
-        file.file.seek(0, os.SEEK_END)
-        size = file.file.tell()
-        file.file.seek(0)
-    except Exception as e:
-        return JSONResponse(status_code=400, content={"detail": f"File validation failed: {str(e)}"})
-    # Existing validation
+    """Streams the upload into the store in fixed-size chunks and queues it for OCR.
+
+    The size limit is checked from Content-Length before the body is read (or
+    on the bytes received, for chunked uploads; see UploadSizeLimit) and again
+    while copying, so an oversize file is never held in memory.
+    """
     try:
-        validate_file(file)
+        with metrics.stage("validate"):
+            validate_file(file)
     except HTTPException as e:
         return JSONResponse(status_code=e.status_code, content={"detail": str(e.detail)})
     except Exception as e:
         return JSONResponse(status_code=400, content={"detail": f"Unexpected file validation error: {str(e)}"})
 
-    filename = os.path.join(UPLOAD_DIR, file.filename)
+    ext = os.path.splitext(file.filename)[1].lower()
     try:
-        content = await file.read()
-        with open(filename, "wb") as f:
-            f.write(content)
+        with metrics.stage("store_write"):
+            content_hash, path = await run_in_threadpool(store.ingest, file.file, ext, MAX_FILE_SIZE_BYTES)
+    except store.TooLarge:
+        return JSONResponse(status_code=413, content={"detail": FILE_TOO_LARGE})
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": f"Failed to save file: {str(e)}"})
 
-    ext = os.path.splitext(file.filename)[1].lower()
     try:
-        text = extract_text(content, ext)
+        with metrics.stage("dedup_lookup"):
+            existing = await _find_existing(content_hash)
     except Exception as e:
-        return JSONResponse(status_code=500, content={"detail": f"Failed to extract text: {str(e)}"})
-    if not text:
-        return JSONResponse(status_code=400, content={"detail": "Could not extract text from file."})
+        return JSONResponse(status_code=500, content={"detail": f"Database error: {str(e)}"})
+    if existing is not None:
+        metrics.inc(metrics.CACHE_HITS, cache="upload_dedup")
+        return JSONResponse(existing)
+    metrics.inc(metrics.CACHE_MISSES, cache="upload_dedup")
 
     try:
-        parsed = parse_receipt_text(text)
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"detail": f"Failed to parse receipt: {str(e)}"})
-
-    # Check for required fields
-    required_fields = ["vendor", "date", "amount", "category"]
-    for k in required_fields:
-        if not parsed.get(k):
-            if k in ("date", "amount"):
-                parsed[k] = None
-            else:
-                parsed[k] = "N/A"
-
-   
-    try:
-        validated = TransactionModel(
-            id=None,
-            receipt_id=0,
-            vendor=parsed["vendor"],
-            date=parsed["date"],
-            amount=parsed["amount"],
-            category=parsed["category"],
-            currency=parsed.get("currency")
-        )
-    except Exception as e:
-        validated = None
+        job = jobs.submit(jobs.new_job_id(), path, file.filename, content_hash)
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"detail": str(e.detail)})
+    return JSONResponse(status_code=202, content=job)
 
-    db = SessionLocal()
+
+@app.post("/upload/batch/")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """Ingests many receipts at once, given as separate files and/or ZIP archives.
+
+    Waits for the whole batch and returns a per-file manifest with throughput.
+    """
     try:
-        receipt = Receipt(filename=file.filename, upload_date=date.today())
-        db.add(receipt)
-        db.commit()
-        db.refresh(receipt)
-        transaction = Transaction(
-            receipt_id=receipt.id,
-            vendor=parsed["vendor"],
-            date=parsed["date"],
-            amount=parsed["amount"],
-            category=parsed["category"],
-            currency=parsed.get("currency")
-        )
-        db.add(transaction)
-        db.commit()
-        db.refresh(transaction)
-       
-        line_items = extract_line_items(text)
-        for li in line_items:
-            db.add(LineItem(transaction_id=transaction.id, item=li['item'], price=li['price']))
-        db.commit()
-       
-        if parsed.get("date") and hasattr(parsed["date"], "isoformat"):
-            parsed["date"] = parsed["date"].isoformat()
-
-        response_data = {
-            "filename": file.filename,
-            "receipt_id": receipt.id,
-            "transaction_id": transaction.id,
-            "message": "File uploaded, parsed, and stored successfully (some fields may be missing).",
-            "extracted": parsed,
-            "line_items": line_items
-        }
+        return await ingest_batch(files)
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"detail": str(e.detail)})
     except Exception as e:
-        db.rollback()
-        return JSONResponse(status_code=500, content={"detail": f"Database error: {str(e)}"})
-    finally:
-        db.close()
-    return JSONResponse(response_data)
+        return JSONResponse(status_code=500, content={"detail": f"Batch upload failed: {str(e)}"})
+
+
+async def _find_existing(content_hash: str):
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(existing_result, content_hash)
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"detail": "Job not found."})
+    return jobs.public_view(job)
 
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"detail": "Job not found."})
+    if job["status"] == "failed":
+        return JSONResponse(status_code=job["error"]["status_code"], content={"detail": job["error"]["detail"]})
+    if job["status"] != "done":
+        return JSONResponse(status_code=202, content=jobs.public_view(job))
+    return JSONResponse(job["result"])
+
+async def _current_etag(db) -> str:
+    value = (await db.execute(DATA_VERSION_QUERY)).scalar()
+    return f'"{int(value) if value else 0}"'
+
+
+def _not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """A 304 if the client's If-None-Match names *etag*; otherwise tags *response* with it."""
+    header = request.headers.get("if-none-match")
+    if header is not None:
+        tags = {t.strip() for t in header.split(",")}
+        if "*" in tags or etag in tags or "W/" + etag in tags:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return None
+
+
+# The read endpoints below check the data version before anything else, so a
+# revalidation that matches costs one app_meta lookup.
 @app.get("/transactions/")
-def get_transactions(
+async def get_transactions(
+    request: Request,
+    response: Response,
     vendor: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     keyword: Optional[str] = Query(None),
@@ -162,163 +229,311 @@ def get_transactions(
     date_to: Optional[str] = Query(None),
     amount_min: Optional[float] = Query(None),
     amount_max: Optional[float] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = Query(None, description="Return transactions with an id greater than this cursor"),
+    include: Optional[str] = Query(None, description="line_items: embed each transaction's line items"),
 ):
-    db = SessionLocal()
     try:
-        query = db.query(Transaction)
-        results = query.all()
-       
-        data = [
-            {
-                "id": t.id,
-                "receipt_id": t.receipt_id,
-                "vendor": t.vendor,
-                "date": t.date,
-                "amount": t.amount,
-                "category": t.category,
-                "currency": t.currency
-            }
-            for t in results
-        ]
-       
-        if vendor:
-            data = linear_search(data, vendor, ["vendor"])
-        if category:
-            data = linear_search(data, category, ["category"])
-        if keyword:
-            data = linear_search(data, keyword, ["vendor", "category"])
-        if date_from:
-            data = [t for t in data if t["date"] and str(t["date"]) >= date_from]
-        if date_to:
-            data = [t for t in data if t["date"] and str(t["date"]) <= date_to]
-        if amount_min is not None:
-            data = [t for t in data if t["amount"] is not None and t["amount"] >= amount_min]
-        if amount_max is not None:
-            data = [t for t in data if t["amount"] is not None and t["amount"] <= amount_max]
-       
-        for t in data:
-            if t["date"]:
-                t["date"] = t["date"].isoformat()
-        return {"transactions": data}
+        includes = parse_includes(include)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    try:
+        stmt = apply_transaction_filters(
+            select(*TRANSACTION_COLUMNS),
+            vendor=vendor, category=category, keyword=keyword,
+            date_from=date_from, date_to=date_to,
+            amount_min=amount_min, amount_max=amount_max,
+        )
+        async with AsyncSessionLocal() as db:
+            not_modified = _not_modified(request, response, await _current_etag(db))
+            if not_modified:
+                return not_modified
+            rows = (await db.execute(keyset(stmt, limit, after))).all()
+            rows, next_after = split_page(rows, limit)
+            data = [row_to_dict(r) for r in rows]
+            if "line_items" in includes and data:
+                ids = [t["id"] for t in data]
+                _attach_line_items(data, (await db.execute(line_items_query(ids))).all())
+        return {"transactions": data, "next_after": next_after}
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": f"Failed to fetch transactions: {str(e)}"})
-    finally:
-        db.close()
+
+
+@app.get("/transactions/changes")
+async def get_transaction_changes(
+    since: Optional[str] = Query(None, description="version from the previous response; omit for a full sync"),
+    limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=MAX_CHANGES_PAGE_SIZE),
+):
+    """Transactions inserted or changed since a version token, oldest change first.
+
+    Pass the returned ``version`` as the next ``since``; while ``has_more``
+    is true there are further rows up to the version this page was cut at.
+    Rows carry their full current state, so applying them is an upsert by id.
+    """
+    try:
+        after_version, after_id = parse_change_token(since)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "since must be a version token from an earlier response."})
+    try:
+        async with AsyncSessionLocal() as db:
+            # Cut the page at the current version, read first: later commits
+            # carry higher versions and are picked up by the next call
+            upto = int((await db.execute(DATA_VERSION_QUERY)).scalar() or 0)
+            stmt = changes_query(select(*TRANSACTION_COLUMNS, Transaction.version), after_version, after_id, upto)
+            rows = (await db.execute(stmt.limit(limit + 1))).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if has_more:
+            token = change_token(rows[-1].version, rows[-1].id)
+        else:
+            token = change_token(max(upto, after_version))
+        return {"transactions": [row_to_dict(r) for r in rows], "version": token, "has_more": has_more}
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Failed to fetch changes: {str(e)}"})
+
+
+@app.get("/transactions/export")
+async def export_transactions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    vendor: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    keyword: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None),
+    date_to: Optional[str] = Query(None),
+    amount_min: Optional[float] = Query(None),
+    amount_max: Optional[float] = Query(None),
+):
+    """Every matching transaction, streamed in id order as it is read."""
+    if format == "parquet" and not export.parquet_available():
+        return JSONResponse(status_code=501, content={"detail": "Parquet export needs pyarrow installed on the server."})
+    stmt = apply_transaction_filters(
+        select(*TRANSACTION_COLUMNS),
+        vendor=vendor, category=category, keyword=keyword,
+        date_from=date_from, date_to=date_to,
+        amount_min=amount_min, amount_max=amount_max,
+    )
+    return StreamingResponse(
+        export.stream(stmt.order_by(Transaction.id), format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="transactions.{format}"'},
+    )
+
+
+def _attach_line_items(data, item_rows) -> None:
+    items = group_line_items(item_rows)
+    for t in data:
+        t["line_items"] = items.get(t["id"], [])
+
+
+def _rows_to_dicts(rows):
+    return [row_to_dict(r) for r in rows]
 
 
 @app.get("/transactions/sorted/")
-def get_sorted_transactions(
-    sort_by: str = Query("date", regex="^(date|amount)$"),
-    order: str = Query("desc", regex="^(asc|desc)$"),
+async def get_sorted_transactions(
+    request: Request,
+    response: Response,
+    sort_by: str = Query("date", pattern="^(date|amount|relevance)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
     vendor: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     keyword: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, description="Return only the first N transactions (default: all)"),
+    include: Optional[str] = Query(None, description="line_items: embed each transaction's line items"),
 ):
-    db = SessionLocal()
     try:
-        query = db.query(Transaction)
-        results = query.all()
-        data = [
-            {
-                "id": t.id,
-                "receipt_id": t.receipt_id,
-                "vendor": t.vendor,
-                "date": t.date,
-                "amount": t.amount,
-                "category": t.category,
-                "currency": t.currency
-            }
-            for t in results
-        ]
-    
-        if vendor:
-            data = linear_search(data, vendor, ["vendor"])
-        if category:
-            data = linear_search(data, category, ["category"])
-        if keyword:
-            data = linear_search(data, keyword, ["vendor", "category"])
-      
-        reverse = order == "desc"
-       
-        data = timsort(data, sort_by, reverse=reverse)
-        for t in data:
-            if t["date"]:
-                t["date"] = t["date"].isoformat()
+        includes = parse_includes(include)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    try:
+        if sort_by == "relevance":
+            fts_query = match_query(keyword) if keyword else None
+            if fts_query is None:
+                return JSONResponse(status_code=400, content={"detail": "sort_by=relevance needs a keyword to rank by."})
+            # Best BM25 match first; the keyword is applied by the join itself
+            ranked = ranked_matches(fts_query)
+            stmt = apply_transaction_filters(
+                select(*TRANSACTION_COLUMNS).join(ranked, ranked.c.id == Transaction.id),
+                vendor=vendor, category=category,
+            )
+            parts = [stmt.order_by(ranked.c.rank, Transaction.id)]
+        else:
+            stmt = apply_transaction_filters(
+                select(*TRANSACTION_COLUMNS),
+                vendor=vendor, category=category, keyword=keyword,
+            )
+            # Ordered in SQL; with a limit, straight off the (column, id) indexes
+            parts = list(sorted_parts(stmt, sort_by, order == "desc", limited=limit is not None))
+        async with AsyncSessionLocal() as db:
+            not_modified = _not_modified(request, response, await _current_etag(db))
+            if not_modified:
+                return not_modified
+            rows = []
+            for part in parts:
+                if limit is not None:
+                    if len(rows) >= limit:
+                        break
+                    part = part.limit(limit - len(rows))
+                rows.extend((await db.execute(part)).all())
+            item_rows = None
+            if "line_items" in includes and rows:
+                # Unpaged, the listing's own filters make the IN subquery, so
+                # it stays one query however many rows match
+                ids = [r.id for r in rows] if limit is not None else stmt.with_only_columns(Transaction.id)
+                item_rows = (await db.execute(line_items_query(ids))).all()
+        # A full listing can be large; keep the conversion off the event loop
+        data = await run_in_threadpool(_rows_to_dicts, rows)
+        if item_rows is not None:
+            _attach_line_items(data, item_rows)
         return {"transactions": data}
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": f"Failed to fetch sorted transactions: {str(e)}"})
-    finally:
-        db.close()
+
+
+def _with_moving_avg(stats):
+    monthly = stats["monthly_totals"]
+    stats["monthly_moving_avg"] = sliding_window_aggregation(monthly, window=3) if monthly else {}
+    return stats
+
+
+def _rollup_stats(db):
+    return _with_moving_avg(rollups.read_stats(db))
+
+
+def _approx_group_stats(loaded, top_n):
+    return _with_moving_avg(rollups.approx_stats(loaded, top_n))
+
+
+def _top_vendors(stats, top_n):
+    if top_n is not None:
+        ranked = sorted(stats["vendor_frequency"].items(), key=lambda kv: -kv[1])
+        stats["vendor_frequency"] = dict(ranked[:top_n])
+    return stats
+
+
+def _filtered_stats(rows):
+    # One columnar copy of the rows serves every aggregate below
+    columns = TransactionColumns.from_records([r._mapping for r in rows])
+    stats = columns.aggregates()
+    stats["count"] = columns.amount_count()
+    stats["vendor_frequency"] = columns.frequency("vendor")
+    stats["category_frequency"] = columns.frequency("category")
+    # Rows without a date are left out of the monthly totals
+    monthly = columns.monthly_totals()
+    stats["monthly_totals"] = monthly
+    stats["monthly_moving_avg"] = sliding_window_aggregation(dict(sorted(monthly.items())), window=3) if monthly else {}
+    return stats
+
 
 @app.get("/transactions/stats/")
-def get_transaction_stats(
+async def get_transaction_stats(
+    request: Request,
+    response: Response,
     date_from: Optional[str] = Query(None),
     date_to: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     vendor: Optional[str] = Query(None),
     keyword: Optional[str] = Query(None),
+    approx: bool = Query(False, description="median, mode, quantiles and top vendors from mergeable sketches"),
+    top_n: Optional[int] = Query(None, ge=1, description="only the top_n most frequent vendors"),
 ):
-    db = SessionLocal()
     try:
-        query = db.query(Transaction)
-        results = query.all()
-        data = [
-            {
-                "id": t.id,
-                "receipt_id": t.receipt_id,
-                "vendor": t.vendor,
-                "date": t.date,
-                "amount": t.amount,
-                "category": t.category,
-                "currency": t.currency
-            }
-            for t in results
-        ]
-       
-        if vendor:
-            data = linear_search(data, vendor, ["vendor"])
-        if category:
-            data = linear_search(data, category, ["category"])
-        if keyword:
-            data = linear_search(data, keyword, ["vendor", "category"])
-        # Aggregation
-        amounts = [t["amount"] for t in data if t["amount"] is not None]
-        stats = compute_aggregates(data, "amount")
-        stats["count"] = len(amounts)
-        stats["vendor_frequency"] = frequency_distribution(data, "vendor")
-        stats["category_frequency"] = frequency_distribution(data, "category")
-        # Only transactions with date for monthly aggregation
-        monthly = monthly_aggregation([t for t in data if t["date"] is not None], "date", "amount")
-        stats["monthly_totals"] = monthly
-        stats["monthly_moving_avg"] = sliding_window_aggregation(dict(sorted(monthly.items())), window=3) if monthly else {}
-        return stats
+        async with AsyncSessionLocal() as db:
+            not_modified = _not_modified(request, response, await _current_etag(db))
+            if not_modified:
+                return not_modified
+            if approx:
+                # A sketch only tracks VENDOR_COUNTERS vendors
+                top_n = min(top_n or rollups.STATS_TOP_N, VENDOR_COUNTERS)
+                if not (vendor or keyword):
+                    loaded = await db.run_sync(rollups.load_approx_groups, category, date_from, date_to)
+                    if loaded is not None:
+                        # Decoding and merging the sketches is CPU work; keep it off the event loop
+                        return await run_in_threadpool(_approx_group_stats, loaded, top_n)
+                # Filters that cut across groups: one pass over the matching rows
+                stmt = apply_transaction_filters(
+                    select(Transaction.vendor, Transaction.date, Transaction.amount, Transaction.category),
+                    vendor=vendor, category=category, keyword=keyword,
+                    date_from=date_from, date_to=date_to,
+                )
+                accumulator = rollups.StatsAccumulator()
+                result = await db.stream(stmt.execution_options(yield_per=rollups.SKETCH_BATCH_ROWS))
+                async for rows in result.partitions():
+                    await run_in_threadpool(accumulator.add, rows)
+                return _with_moving_avg(await run_in_threadpool(accumulator.result, top_n))
+            if not any((date_from, date_to, category, vendor, keyword)):
+                # The rollup reader is shared with the sync code paths
+                return _top_vendors(await db.run_sync(_rollup_stats), top_n)
+            stmt = apply_transaction_filters(
+                select(*TRANSACTION_COLUMNS),
+                vendor=vendor, category=category, keyword=keyword,
+                date_from=date_from, date_to=date_to,
+            )
+            rows = (await db.execute(stmt.order_by(Transaction.id))).all()
+        return _top_vendors(await run_in_threadpool(_filtered_stats, rows), top_n)
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": f"Failed to fetch transaction stats: {str(e)}"})
-    finally:
-        db.close()
 
 @app.get("/transactions/{transaction_id}/items/")
-def get_line_items(transaction_id: int):
-    db = SessionLocal()
+async def get_line_items(transaction_id: int, request: Request, response: Response):
+    stmt = select(LineItem.item, LineItem.price).filter(LineItem.transaction_id == transaction_id).order_by(LineItem.id)
+    async with AsyncSessionLocal() as db:
+        not_modified = _not_modified(request, response, await _current_etag(db))
+        if not_modified:
+            return not_modified
+        items = (await db.execute(stmt)).all()
+    return [{"item": i.item, "price": i.price} for i in items]
+
+@app.get("/line_items/")
+async def get_line_items_bulk(
+    request: Request,
+    response: Response,
+    transaction_ids: str = Query(..., description=f"Comma-separated transaction ids, at most {MAX_PAGE_SIZE}"),
+):
+    """Line items of many transactions at once, keyed by transaction id."""
     try:
-        items = db.query(LineItem).filter(LineItem.transaction_id == transaction_id).all()
-        return [{"item": i.item, "price": i.price} for i in items]
-    finally:
-        db.close()
+        ids = list(dict.fromkeys(int(i) for i in transaction_ids.split(",") if i.strip()))
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "transaction_ids must be comma-separated integers."})
+    if len(ids) > MAX_PAGE_SIZE:
+        return JSONResponse(status_code=400, content={"detail": f"At most {MAX_PAGE_SIZE} transaction_ids per request."})
+    try:
+        async with AsyncSessionLocal() as db:
+            not_modified = _not_modified(request, response, await _current_etag(db))
+            if not_modified:
+                return not_modified
+            rows = (await db.execute(line_items_query(ids))).all() if ids else []
+        return {"line_items": group_line_items(rows, ids)}
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Failed to fetch line items: {str(e)}"})
+
 # Manual trigger to recategorize all transactions
 @app.post("/maintenance/recategorize/")
 def recategorize_transactions():
+    return JSONResponse(status_code=202, content=recategorize.start(force=True))
+
+@app.get("/maintenance/recategorize/")
+def recategorize_progress():
+    return recategorize.status()
+
+# Regenerate the stats rollups from the raw transactions table
+@app.post("/maintenance/rollups/rebuild/")
+def rebuild_rollups():
     db = SessionLocal()
     try:
-        transactions = db.query(Transaction).all()
-        updated = 0
-        for t in transactions:
-            new_cat = extract_category(t.vendor)
-            if new_cat != t.category:
-                t.category = new_cat
-                updated += 1
-        if updated:
-            db.commit()
-        return {"updated": updated}
+        groups = rollups.rebuild(db)
+        db.commit()
+        return {"groups": groups}
+    except Exception as e:
+        db.rollback()
+        return JSONResponse(status_code=500, content={"detail": f"Failed to rebuild rollups: {str(e)}"})
+    finally:
+        db.close()
+
+@app.get("/maintenance/rollups/check/")
+def check_rollups():
+    db = SessionLocal()
+    try:
+        return rollups.check(db)
     finally:
         db.close() 
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""Lightweight in-process metrics, exposed in Prometheus text format at /metrics.
+
+Timers keep a count, a sum and the most recent SAMPLE_SIZE observations, from
+which p50/p95/p99 are computed at scrape time; counters are plain totals.
+Everything is off unless METRICS_ENABLED is set; while off, the helpers
+return before touching any state and no hooks are installed.
+
+OCR and parsing run in worker processes, so workers capture their
+observations with ``captured()`` and hand them back with the job outcome for
+the API process to ``merge()``.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+ENABLED = os.environ.get("METRICS_ENABLED", "").lower() in ("1", "true", "yes", "on")
+SAMPLE_SIZE = int(os.environ.get("METRICS_SAMPLE_SIZE", 2048))
+QUANTILES = (0.5, 0.95, 0.99)
+
+STAGE_SECONDS = "intellij_stage_seconds"
+REQUEST_SECONDS = "intellij_http_request_seconds"
+DB_QUERY_SECONDS = "intellij_db_query_seconds"
+OCR_PAGES = "intellij_ocr_pages_total"
+OCR_FALLBACKS = "intellij_ocr_fallbacks_total"
+CACHE_HITS = "intellij_cache_hits_total"
+CACHE_MISSES = "intellij_cache_misses_total"
+BYTES_PROCESSED = "intellij_bytes_processed_total"
+
+_HELP = {
+    STAGE_SECONDS: ("summary", "Time spent in each upload pipeline stage."),
+    REQUEST_SECONDS: ("summary", "HTTP request latency by route."),
+    DB_QUERY_SECONDS: ("summary", "Database statement execution time by statement type."),
+    OCR_PAGES: ("counter", "Pages and images handled by text extraction, by source."),
+    OCR_FALLBACKS: ("counter", "Images the resident OCR engine failed on and pytesseract handled."),
+    CACHE_HITS: ("counter", "Cache hits by cache."),
+    CACHE_MISSES: ("counter", "Cache misses by cache."),
+    BYTES_PROCESSED: ("counter", "Bytes read or written, by stage."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_timers: Dict[Tuple[str, Labels], Dict[str, Any]] = {}
+_counters: Dict[Tuple[str, Labels], float] = {}
+# Set in worker processes while a job runs; observations go here instead
+_capture: Optional[List[Tuple[str, str, Labels, float]]] = None
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _record(kind: str, name: str, labels: Labels, value: float) -> None:
+    if _capture is not None:
+        _capture.append((kind, name, labels, value))
+        return
+    key = (name, labels)
+    with _lock:
+        if kind == "counter":
+            _counters[key] = _counters.get(key, 0) + value
+            return
+        series = _timers.get(key)
+        if series is None:
+            series = _timers[key] = {"count": 0, "sum": 0.0, "samples": deque(maxlen=SAMPLE_SIZE)}
+        series["count"] += 1
+        series["sum"] += value
+        series["samples"].append(value)
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    if ENABLED:
+        _record("timer", name, _labels(labels), seconds)
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    if ENABLED:
+        _record("counter", name, _labels(labels), value)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record("timer", self.name, _labels(self.labels), time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str, **labels):
+    """``with metrics.timer(STAGE_SECONDS, stage="parse"): ...``"""
+    return _Timer(name, labels) if ENABLED else _NULL_TIMER
+
+
+def stage(name: str):
+    return _Timer(STAGE_SECONDS, {"stage": name}) if ENABLED else _NULL_TIMER
+
+
+@contextmanager
+def captured() -> Iterator[List[Tuple[str, str, Labels, float]]]:
+    """Collects this process's observations into a list instead of the registry."""
+    global _capture
+    observations: List[Tuple[str, str, Labels, float]] = []
+    if not ENABLED:
+        yield observations
+        return
+    previous, _capture = _capture, observations
+    try:
+        yield observations
+    finally:
+        _capture = previous
+
+
+def merge(observations: Optional[List[Tuple[str, str, Labels, float]]]) -> None:
+    """Adds observations captured in a worker process to this process's registry."""
+    if not ENABLED or not observations:
+        return
+    for kind, name, labels, value in observations:
+        _record(kind, name, tuple(tuple(pair) for pair in labels), value)
+
+
+_VERB = re.compile(r"\s*(\w+)")
+
+
+def instrument_engine(engine) -> None:
+    """Times every statement on *engine* via cursor execute events."""
+    if not ENABLED:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        verb = _VERB.match(statement)
+        observe(DB_QUERY_SECONDS, elapsed, statement=verb.group(1).upper() if verb else "OTHER")
+
+
+def _quantile(ordered: List[float], q: float) -> float:
+    # Nearest rank
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    # Exact: a large counter cut to 6 significant digits stops moving, and
+    # rate()/increase() over it read zero
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer() and abs(value) < 2 ** 53:
+        return str(int(value))
+    return repr(value)
+
+
+def render() -> str:
+    """The registry in Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        timers = {key: (s["count"], s["sum"], sorted(s["samples"])) for key, s in _timers.items()}
+        counters = dict(_counters)
+    lines = []
+    for name, (kind, help_text) in _HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            continue
+        for (series, labels), (count, total, ordered) in sorted(timers.items()):
+            if series != name:
+                continue
+            for q in QUANTILES:
+                lines.append(f"{name}{_format_labels(labels, (('quantile', str(q)),))} {_format_value(_quantile(ordered, q))}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    with _lock:
+        _timers.clear()
+        _counters.clear()
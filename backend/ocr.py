@@ -1,49 +1,476 @@
 import pytesseract
-from PIL import Image, ImageFilter
+from PIL import Image, ImageOps
 import pdfplumber
+import PyPDF2
 import io
-from typing import Optional
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Optional, Tuple, Union
+from . import metrics
 pytesseract.pytesseract.tesseract_cmd = r"C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
 
-def preprocess_image(image: Image.Image) -> Image.Image:
-  
-    image = image.convert('L')
-   
-    image = image.point(lambda x: 0 if x < 140 else 255, '1')
-   
-    image = image.filter(ImageFilter.SHARPEN)
+logger = logging.getLogger(__name__)
+
+# "auto" uses resident tesserocr handles when the binding is installed and
+# works, and the pytesseract subprocess path otherwise
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "auto").lower()
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+if OCR_ENGINE not in ("auto", "tesserocr", "pytesseract"):
+    raise ValueError(f"OCR_ENGINE must be auto, tesserocr or pytesseract, not {OCR_ENGINE!r}")
+
+# Shared pool for OCR of scanned PDF pages, and the per-file cap on how many
+# of one document's pages may occupy it at once.  OCR_PAGE_WORKERS also caps
+# the tesserocr handles of one process; every OCR worker process (jobs.py,
+# OCR_WORKERS) has its own, so up to OCR_WORKERS x OCR_PAGE_WORKERS handles,
+# each holding its own copy of the language data, can be resident at once.
+OCR_PAGE_WORKERS = int(os.environ.get("OCR_PAGE_WORKERS", os.cpu_count() or 1))
+PDF_PAGE_PARALLELISM = int(os.environ.get("PDF_PAGE_PARALLELISM", 4))
+# Content-stream text averaging longer lines than this is treated as
+# unordered and re-extracted with pdfplumber's layout analysis
+PDF_PROBE_MAX_LINE = int(os.environ.get("PDF_PROBE_MAX_LINE", 200))
+
+# Scanned PDF pages are rasterised at OCR_TARGET_DPI, and scans that declare a
+# higher DPI are scaled down to it.  Phone photos rarely carry a meaningful
+# DPI, so they are capped at OCR_MAX_SIDE pixels on the long side instead.
+OCR_TARGET_DPI = int(os.environ.get("OCR_TARGET_DPI", 300))
+OCR_MAX_SIDE = int(os.environ.get("OCR_MAX_SIDE", 2048))
+# Blank border, in pixels, left around the ink when auto-cropping
+AUTOCROP_MARGIN = int(os.environ.get("OCR_AUTOCROP_MARGIN", 16))
+DRAFT_SLACK = 0.75
+THRESHOLD = 140
+_THRESHOLD_TABLE = [0 if x < THRESHOLD else 255 for x in range(256)]
+
+_page_pool: Optional[ThreadPoolExecutor] = None
+_page_pool_lock = threading.Lock()
+
+# Extraction accepts the file's bytes or, preferably, its path: PIL and
+# pdfplumber then read from the file as needed instead of from a full copy
+Source = Union[bytes, str]
+
+def _open_source(source: Source) -> Union[BinaryIO, str]:
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+def _scale_for(image: Image.Image, cap_side: bool) -> float:
+    scale = 1.0
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] > OCR_TARGET_DPI:
+        scale = OCR_TARGET_DPI / float(dpi[0])
+    longest = max(image.size) * scale
+    if cap_side and longest > OCR_MAX_SIDE:
+        scale *= OCR_MAX_SIDE / longest
+    return scale
+
+
+def load_image(image: Image.Image, cap_side: bool = True) -> Image.Image:
+    """Greyscale copy of *image* at no more than the OCR resolution.
+
+    For a JPEG that has not been decoded yet, draft mode lets libjpeg scale
+    by 1/2, 1/4 or 1/8 and convert to greyscale while decoding, so a 12 MP
+    photo is never decoded at full size.  Landing up to DRAFT_SLACK below the
+    target is accepted to get there; otherwise an area-averaging resize
+    finishes the job.
+    """
+    scale = _scale_for(image, cap_side)
+    if scale >= 1:
+        return image.convert("L")
+    target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    if image.format == "JPEG":
+        image.draft("L", (int(target[0] * DRAFT_SLACK), int(target[1] * DRAFT_SLACK)))
+    image = image.convert("L")
+    if image.width > target[0]:
+        image = image.resize(target, Image.Resampling.BOX)
     return image
 
-def extract_text_from_image(file_bytes: bytes) -> str:
-    image = Image.open(io.BytesIO(file_bytes))
-    image = preprocess_image(image)
+
+def autocrop(image: Image.Image) -> Image.Image:
+    """Trims what surrounds the text of a thresholded (0/255) image.
+
+    Dark borders (a table behind a photographed receipt, scanner edges) go
+    first, then the blank margin around the ink, leaving AUTOCROP_MARGIN.
+    """
+    paper = image.getbbox()
+    if paper is None:
+        return image
+    image = image.crop(paper)
+    ink = ImageOps.invert(image).getbbox()
+    if ink is None:
+        return image
+    left, top, right, bottom = ink
+    m = AUTOCROP_MARGIN
+    return image.crop((max(0, left - m), max(0, top - m), min(image.width, right + m), min(image.height, bottom + m)))
+
+
+def preprocess_image(image: Image.Image, cap_side: bool = True) -> Image.Image:
+    """Downsampled, greyscale, thresholded and cropped image ready for OCR.
+
+    The threshold is a lookup table.  The old SHARPEN pass is gone: run on a
+    1-bit image it returned the same pixels.
+    """
+    with metrics.stage("ocr_preprocess"):
+        image = load_image(image, cap_side).point(_THRESHOLD_TABLE)
+        return autocrop(image).convert("1", dither=Image.Dither.NONE)
+
+class PytesseractEngine:
+    """Runs the tesseract CLI once per image (via a temp file)."""
+    name = "pytesseract"
+
+    def image_to_string(self, image: Image.Image) -> str:
+        return pytesseract.image_to_string(image, lang=OCR_LANG)
+
+    def healthy(self) -> bool:
+        try:
+            pytesseract.get_tesseract_version()
+            return True
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        pass
+
+
+class TesserocrEngine:
+    """A pool of long-lived Tesseract API handles (tesserocr binding).
+
+    Each handle loads the language data once and takes images in memory, so
+    a receipt costs only the recognition itself.  A handle is used by one
+    thread at a time; at most *size* exist.  One that raises is ended and
+    replaced by a fresh, health-checked handle before the image is retried.
+    """
+    name = "tesserocr"
+
+    def __init__(self, size: int):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._size = size
+        self._created = 0
+        self._lock = threading.Lock()
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        with self._lock:
+            self._created += 1
+        self._idle.put(self._new_handle())
+
+    def _new_handle(self):
+        """Starts a handle and checks it on a blank image.  The caller has counted it."""
+        try:
+            api = self._tesserocr.PyTessBaseAPI(lang=OCR_LANG)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        try:
+            api.SetImage(Image.new("L", (32, 32), 255))
+            api.GetUTF8Text()
+            api.Clear()
+        except Exception:
+            self._discard(api)
+            raise
+        return api
+
+    def _discard(self, api) -> None:
+        with self._lock:
+            self._created -= 1
+        try:
+            api.End()
+        except Exception:
+            pass
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            grow = self._created < self._size
+            if grow:
+                self._created += 1
+        return self._new_handle() if grow else self._idle.get()
+
+    def _recognise(self, api, image: Image.Image) -> str:
+        api.SetImage(image)
+        text = api.GetUTF8Text()
+        api.Clear()
+        return text
+
+    def image_to_string(self, image: Image.Image) -> str:
+        api = self._acquire()
+        try:
+            text = self._recognise(api, image)
+        except Exception:
+            logger.warning("tesserocr handle failed, restarting it", exc_info=True)
+            self._discard(api)
+            with self._lock:
+                self._created += 1
+            api = self._new_handle()
+            try:
+                text = self._recognise(api, image)
+            except Exception:
+                self._discard(api)
+                raise
+        self._idle.put(api)
+        return text
+
+    def healthy(self) -> bool:
+        try:
+            self.image_to_string(Image.new("L", (32, 32), 255))
+            return True
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_engine = None
+_fallback_engine = PytesseractEngine()
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The OCR engine for this process, chosen on first use from OCR_ENGINE."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = _fallback_engine
+            if OCR_ENGINE in ("auto", "tesserocr"):
+                try:
+                    _engine = TesserocrEngine(OCR_PAGE_WORKERS)
+                except ImportError:
+                    if OCR_ENGINE == "tesserocr":
+                        logger.warning("tesserocr is not installed, using pytesseract")
+                except Exception as e:
+                    logger.warning("tesserocr failed its health check, using pytesseract: %s", e)
+            if not _engine.healthy():
+                logger.warning("%s failed its health check; OCR will fail until Tesseract is installed",
+                               _engine.name)
+        return _engine
+
+
+def reset_engine(failed=None) -> None:
+    """Closes the current engine; the next OCR call picks one again.
+
+    With *failed*, only if that is still the current engine, so threads that
+    saw the same failure close it once.
+    """
+    global _engine
+    with _engine_lock:
+        if failed is not None and _engine is not failed:
+            return
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.close()
+
+
+def image_to_string(image: Image.Image) -> str:
+    """OCRs a preprocessed image, falling back to pytesseract if the engine fails."""
+    engine = get_engine()
     try:
-        text = pytesseract.image_to_string(image)
+        with metrics.stage("ocr_recognise"):
+            return engine.image_to_string(image)
+    except Exception:
+        if engine is _fallback_engine:
+            raise
+        metrics.inc(metrics.OCR_FALLBACKS, engine=engine.name)
+        logger.warning("%s failed twice, falling back to pytesseract", engine.name, exc_info=True)
+        # Even a fresh handle failed: the next call starts and health-checks a new engine
+        reset_engine(engine)
+        return _fallback_engine.image_to_string(image)
+
+
+def extract_text_from_image(source: Source) -> str:
+    metrics.inc(metrics.OCR_PAGES, source="image")
+    with Image.open(_open_source(source)) as original:
+        image = preprocess_image(original)
+    try:
+        text = image_to_string(image)
     except Exception as e:
         raise RuntimeError(f"Tesseract OCR failed: {e}")
     return text
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    text = ""
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if not page_text:
-                pil_img = page.to_image(resolution=300).original
-                pil_img = preprocess_image(pil_img)
-                try:
-                    page_text = pytesseract.image_to_string(pil_img)
-                except Exception as e:
-                    raise RuntimeError(f"Tesseract OCR failed on PDF page: {e}")
-            text += page_text or ""
-    return text
+def _ocr_page_image(pil_img: Image.Image) -> str:
+    # Already rasterised at OCR_TARGET_DPI, so no further downsampling
+    pil_img = preprocess_image(pil_img, cap_side=False)
+    try:
+        return image_to_string(pil_img)
+    except Exception as e:
+        raise RuntimeError(f"Tesseract OCR failed on PDF page: {e}")
+
+def _get_page_pool() -> ThreadPoolExecutor:
+    # Threads are enough here: tesserocr releases the GIL while recognising,
+    # and pytesseract runs each call in its own tesseract process
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ThreadPoolExecutor(max_workers=OCR_PAGE_WORKERS, thread_name_prefix="ocr-page")
+        return _page_pool
+
+def _has_fonts(resources, depth: int = 0) -> bool:
+    """Whether a page's resources (or a form XObject they use) define a font."""
+    if resources is None:
+        return False
+    resources = resources.get_object()
+    if resources.get("/Font"):
+        return True
+    if depth >= 4:
+        return False
+    for xobject in (resources.get("/XObject") or {}).values():
+        xobject = xobject.get_object()
+        if xobject.get("/Subtype") == "/Form" and _has_fonts(xobject.get("/Resources"), depth + 1):
+            return True
+    return False
+
+def _usable(text: str) -> bool:
+    """Whether text from the content stream can stand in for layout extraction.
+
+    Glyphs without a Unicode mapping come out as U+FFFD or control
+    characters, and text placed by absolute positioning often arrives without
+    line breaks; both need pdfplumber's layout analysis.
+    """
+    if not text.strip() or "\ufffd" in text:
+        return False
+    if sum(1 for c in text if c.isprintable() or c.isspace()) < 0.95 * len(text):
+        return False
+    lines = text.count("\n") + 1
+    return len(text) / lines <= PDF_PROBE_MAX_LINE
+
+class _PdfPages:
+    """Per-page text of a PDF, trying the cheapest source first.
+
+    1. PyPDF2 reads the page's content stream: fast, and enough for the
+       text layer of most generated bills.
+    2. pdfplumber's layout analysis, only for pages whose probe text is
+       missing or unusable although the page has fonts.
+    3. Rasterise and OCR, only for pages without any text.
+
+    pdfplumber is opened on first need, and each page's cached layout is
+    released as soon as the page is done, so a long statement holds one
+    page's objects at a time.
+    """
+
+    def __init__(self, source: Source):
+        self._source = source
+        self._plumber = None
+        try:
+            self._reader = PyPDF2.PdfReader(_open_source(source))
+            self.count = len(self._reader.pages)
+        except Exception:
+            # Let pdfplumber (pdfminer) have a go at files PyPDF2 rejects
+            logger.debug("PyPDF2 could not read the PDF, using pdfplumber", exc_info=True)
+            self._reader = None
+            self.count = len(self._open_plumber().pages)
+
+    def _open_plumber(self):
+        if self._plumber is None:
+            self._plumber = pdfplumber.open(_open_source(self._source))
+        return self._plumber
+
+    def probe(self, number: int) -> Tuple[Optional[str], bool]:
+        """(text, has_fonts) from the content stream; text is None if unusable."""
+        if self._reader is None:
+            return None, True
+        try:
+            page = self._reader.pages[number]
+            text = page.extract_text() or ""
+            has_fonts = _has_fonts(page.get("/Resources"))
+        except Exception:
+            logger.debug("PyPDF2 failed on page %d", number + 1, exc_info=True)
+            return None, True
+        return (text.rstrip("\n") if _usable(text) else None), has_fonts
+
+    def layout_text(self, number: int) -> str:
+        page = self._open_plumber().pages[number]
+        try:
+            return page.extract_text() or ""
+        finally:
+            page.close()
+
+    def image(self, number: int) -> Image.Image:
+        page = self._open_plumber().pages[number]
+        try:
+            return page.to_image(resolution=OCR_TARGET_DPI).original
+        finally:
+            page.close()
+
+    def close(self) -> None:
+        if self._plumber is not None:
+            self._plumber.close()
+
+def extract_text_from_pdf(source: Source, stop_when: Optional[Callable[[str], bool]] = None) -> str:
+    """Extracts text page by page, OCRing pages without a text layer in parallel.
+
+    Pages are read in order on the calling thread (neither PDF library is
+    thread-safe) and scanned ones are handed to a shared pool; at most
+    PDF_PAGE_PARALLELISM pages of one file are in flight at a time.  Output
+    keeps page order, one line break between pages.
+
+    *stop_when* is called with the text of the pages read so far; once it
+    returns True the remaining pages are skipped.
+    """
+    pool = _get_page_pool()
+    parts = []
+    in_flight = deque()
+    prefix = []
+    pages = _PdfPages(source)
+    try:
+        for number in range(pages.count):
+            page_text, has_fonts = pages.probe(number)
+            if page_text is None and has_fonts:
+                page_text = pages.layout_text(number).rstrip("\n")
+                source_label = "pdf_text_layout"
+            else:
+                source_label = "pdf_text_probe"
+            if page_text:
+                metrics.inc(metrics.OCR_PAGES, source=source_label)
+                parts.append(page_text)
+            else:
+                metrics.inc(metrics.OCR_PAGES, source="pdf_ocr")
+                if len(in_flight) >= PDF_PAGE_PARALLELISM:
+                    in_flight.popleft().result()
+                future = pool.submit(_ocr_page_image, pages.image(number))
+                in_flight.append(future)
+                parts.append(future)
+            # Nothing left to skip after the last page
+            if stop_when is None or number + 1 == pages.count:
+                continue
+            # Only the finished leading pages can be checked
+            while len(prefix) < len(parts):
+                part = parts[len(prefix)]
+                if isinstance(part, Future):
+                    if not part.done():
+                        break
+                    part = part.result() or ""
+                prefix.append(part)
+            if prefix and stop_when("\n".join(prefix)):
+                logger.debug("stopping after page %d of %d", number + 1, pages.count)
+                return "\n".join(prefix)
+        return "\n".join(p if isinstance(p, str) else (p.result() or "") for p in parts)
+    finally:
+        for p in parts:
+            if isinstance(p, Future):
+                p.cancel()
+        pages.close()
+
+def extract_text(source: Source, file_ext: str,
+                 stop_when: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+    """Text of an upload given as bytes or as the path of the stored file.
 
-def extract_text(file_bytes: bytes, file_ext: str) -> Optional[str]:
+    *stop_when* lets PDF extraction skip the pages after the ones it accepts.
+    """
     if file_ext in ['.jpg', '.jpeg', '.png']:
-        return extract_text_from_image(file_bytes)
+        return extract_text_from_image(source)
     elif file_ext == '.pdf':
-        return extract_text_from_pdf(file_bytes)
+        return extract_text_from_pdf(source, stop_when)
     elif file_ext == '.txt':
-        return file_bytes.decode(errors='ignore')
+        if isinstance(source, bytes):
+            return source.decode(errors='ignore')
+        with open(source, encoding='utf-8', errors='ignore') as f:
+            return f.read()
     else:
         return None 
\ No newline at end of file
@@ -1,6 +1,10 @@
+import calendar
+import hashlib
+import json
 import re
-from typing import Dict, Optional
-from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from datetime import date
 
 VENDOR_PATTERNS = [
     r"^[A-Z0-9 &.,'-]{5,}$",  
@@ -19,9 +23,10 @@ DATE_PATTERNS = [
     # Apr 20 2024 or April 20 2024
     r"\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*[ -]\d{1,2}[ ,-]\d{4}\b"
 ]
+AMOUNT_LABELS = r"(?:total(?: amount)?|amount(?: due| payable| paid)?|balance|grand total|sum)"
 AMOUNT_PATTERNS = [
     # Label followed by amount (handles Total, Amount Payable etc.)
-    r"(?i)(?:total(?: amount)?|amount(?: due| payable| paid)?|balance|grand total|sum)[^\d]{0,15}(\d[\d,]*(?:[\.,]\d{2})?)",
+    rf"(?i){AMOUNT_LABELS}[^\d]{{0,15}}(\d[\d,]*(?:[\.,]\d{{2}})?)",
     # Currency symbol before amount
     r"(?i)(?:₹\s*|rs\.?\s*)(\d[\d,]*(?:[\.,]\d{2})?)",
     # Currency symbol after amount
@@ -80,99 +85,284 @@ VENDOR_CATEGORY_MAP = {
 }
 
 def extract_vendor(text: str) -> Optional[str]:
-   
-    for pattern in VENDOR_PATTERNS:
-        match = re.search(pattern, text, re.MULTILINE)
-        if match:
-            return match.group(0).strip()
-   
-    for line in text.splitlines():
-        if line.strip() and line.strip().isupper() and len(line.strip()) > 5:
-            return line.strip()
-    return "Unknown"
+    return _receipt_parser.vendor(text)
 
 def extract_date(text: str) -> Optional[str]:
-    for pattern in DATE_PATTERNS:
-        match = re.search(pattern, text)
-        if match:
-            return match.group(0)
-    return None
+    return _receipt_parser.date_string(text)
 
 def extract_amount(text: str) -> Optional[float]:
-    for pattern in AMOUNT_PATTERNS:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            try:
-                return float(match.group(1).replace(',', '').replace(' ', ''))
-            except (ValueError, IndexError):
-                continue
-    return None
+    return _receipt_parser.amount(text)
+
+def extract_labelled_amount(text: str) -> Optional[float]:
+    """The amount after a total/amount label, ignoring bare currency amounts."""
+    return _receipt_parser.amount(text, labelled_only=True)
 
 def extract_currency(text: str) -> Optional[str]:
-    for pattern in CURRENCY_PATTERNS:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return match.group(1).upper().strip()
-    return None
+    return _receipt_parser.currency(text)
 
-def extract_category(vendor: Optional[str]) -> Optional[str]:
-    if vendor:
-        vend_low = vendor.lower()
-        import re as _re
-        for v, cat in VENDOR_CATEGORY_MAP.items():
-            pattern = rf"\b{_re.escape(v.lower())}\b"
-            if _re.search(pattern, vend_low):
-                return cat
-      
-        if any(k in vend_low for k in ("electricity", "power", "bijli", "discom")):
+# Substring fallbacks for vendors missing from VENDOR_CATEGORY_MAP
+ELECTRICITY_KEYWORDS = ("electricity", "power", "bijli", "discom")
+INTERNET_KEYWORDS = ("internet", "broadband", "fibernet")
+
+
+def category_rules_fingerprint() -> str:
+    """Hash of everything extract_category depends on.
+
+    Stored categories only need recomputing when this changes.
+    """
+    rules = [list(VENDOR_CATEGORY_MAP.items()), ELECTRICITY_KEYWORDS, INTERNET_KEYWORDS]
+    return hashlib.sha256(json.dumps(rules).encode()).hexdigest()
+
+
+class VendorClassifier:
+    """Maps vendor names to categories using one precompiled regex.
+
+    Every map key becomes a numbered group in a single alternation wrapped in
+    a lookahead, so one scan finds every key that occurs at every position.
+    The key listed first in the map wins, as with the old per-key search, and
+    results are memoised per normalised vendor string.
+    """
+
+    def __init__(self, vendor_map: Dict[str, str], cache_size: int = 65536):
+        keys, categories = [], []
+        for vendor, category in vendor_map.items():
+            key = vendor.lower()
+            if key not in keys:
+                keys.append(key)
+                categories.append(category)
+        self._categories = categories
+        alternation = "|".join(f"({re.escape(k)})" for k in keys)
+        self._pattern = re.compile(rf"(?=\b(?:{alternation})\b)")
+        self._cached = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, vend_low: str) -> str:
+        best = None
+        for match in self._pattern.finditer(vend_low):
+            idx = match.lastindex - 1
+            if best is None or idx < best:
+                best = idx
+                if best == 0:
+                    break
+        if best is not None:
+            return self._categories[best]
+        if any(k in vend_low for k in ELECTRICITY_KEYWORDS):
             return "Electricity"
-        if any(k in vend_low for k in ("internet", "broadband", "fibernet")):
+        if any(k in vend_low for k in INTERNET_KEYWORDS):
             return "Internet"
-    return "Other"
+        return "Other"
+
+    def classify(self, vendor: Optional[str]) -> str:
+        if not vendor:
+            return "Other"
+        # Surrounding whitespace never changes a word-boundary or substring match
+        return self._cached(vendor.lower().strip())
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+_vendor_classifier = VendorClassifier(VENDOR_CATEGORY_MAP)
+
+def extract_category(vendor: Optional[str]) -> Optional[str]:
+    return _vendor_classifier.classify(vendor)
+
+LINE_ITEM_PATTERN = re.compile(r"([A-Za-z0-9 \-]+)\s+(\d+[\.,]\d{2})")
 
 def extract_line_items(text: str):
-    items = []
-    pattern = re.compile(r"([A-Za-z0-9 \-]+)\s+(\d+[\.,]\d{2})")
-    for line in text.splitlines():
-        match = pattern.search(line)
-        if match:
-            item = match.group(1).strip()
-            price = float(match.group(2).replace(',', '.'))
-            items.append({'item': item, 'price': price})
-    return items
+    return _receipt_parser.line_items(text)
 
-def parse_receipt_text(text: str) -> Dict:
-    vendor = extract_vendor(text)
-    date_str = extract_date(text)
-    amount = extract_amount(text)
-    currency = extract_currency(text)
-    category = extract_category(vendor)
-   
-    date = None
-    if date_str:
-        for fmt in (
-            "%d-%m-%Y",
-            "%d/%m/%Y",
-            "%m/%d/%Y",
-            "%Y-%m-%d",
-            "%B %d, %Y",
-            "%b %d, %Y",
-            "%d %b %Y",
-            "%d %B %Y",
-            "%d-%b-%Y",
-            "%d-%B-%Y",
-            "%b %d %Y",
-            "%B %d %Y",
-        ):
-            try:
-                date = datetime.strptime(date_str, fmt).date()
-                break
-            except ValueError:
+# Month names and abbreviations, as strptime's %B and %b accept them
+_MONTHS = {}
+for _i in range(1, 13):
+    _MONTHS[calendar.month_name[_i].lower()] = _i
+    _MONTHS[calendar.month_abbr[_i].lower()] = _i
+
+
+def _make_date(year, month, day) -> Optional[date]:
+    try:
+        return date(int(year), int(month), int(day))
+    except (TypeError, ValueError):
+        return None
+
+
+def _month_number(name: str) -> Optional[int]:
+    return _MONTHS.get(name.lower())
+
+
+# One converter per DATE_PATTERNS entry.  Each accepts exactly the strings the
+# old strptime format list could parse for that pattern and returns None for
+# the rest (mixed separators, "Sept", impossible dates).
+
+def _date_numeric(s: str) -> Optional[date]:
+    # 31-12-2024 is day first; with slashes day first wins, then month first
+    day, month, year = s[0:2], s[3:5], s[6:]
+    if s[2] != s[5]:
+        return None
+    if s[2] == "-":
+        return _make_date(year, month, day)
+    return _make_date(year, month, day) or _make_date(year, day, month)
+
+
+def _date_iso(s: str) -> Optional[date]:
+    if s[4] == s[7] == "-":
+        return _make_date(s[:4], s[5:7], s[8:])
+    return None
+
+
+def _date_month_day_comma(s: str) -> Optional[date]:
+    # April 20, 2024
+    month, rest = s.split(" ", 1)
+    day, year = rest.split(", ")
+    return _make_date(year, _month_number(month), day)
+
+
+def _date_day_month(s: str) -> Optional[date]:
+    # 20 Apr 2024 or 20-Apr-2024
+    parts = s.split(" ")
+    if len(parts) != 3:
+        parts = s.split("-")
+    if len(parts) != 3:
+        return None
+    day, month, year = parts
+    return _make_date(year, _month_number(month), day)
+
+
+def _date_month_day(s: str) -> Optional[date]:
+    # Apr 20 2024
+    parts = s.split(" ")
+    if len(parts) != 3:
+        return None
+    month, day, year = parts
+    return _make_date(year, _month_number(month), day)
+
+
+DATE_CONVERTERS = [_date_numeric, _date_iso, _date_month_day_comma, _date_day_month, _date_month_day]
+
+
+# Per pattern, literals at least one of which must occur in the text for the
+# pattern to match (None: no cheap test).  A few ``in`` checks are far cheaper
+# than letting the regex engine try every position, and on a typical receipt
+# most lower-priority patterns can be skipped outright.  Case-insensitive
+# patterns are checked against ``text.casefold()``; "nr" rather than "inr"
+# because re.IGNORECASE also lets a dotless ı match "i".
+_MONTH_ABBREVIATIONS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+VENDOR_LITERALS = [
+    None,
+    ("SDN BHD",),
+    None,
+    ("Inc\\", "LLC"),
+    ("Pvt", "Ltd.", "LLP", "PLC", "Limited", "Co.", "Company"),
+    ("Pvt.", "LLP", "Ltd.", "Private Limited", "PLC"),
+]
+DATE_LITERALS = [("/", "-"), ("/", "-"), _MONTH_ABBREVIATIONS, _MONTH_ABBREVIATIONS, _MONTH_ABBREVIATIONS]
+AMOUNT_LITERALS = [("total", "amount", "balance", "sum"), ("₹", "rs"), ("₹", "rs")]
+CURRENCY_LITERALS = [("$", "usd", "eur", "€", "£", "rm", "₹", "nr", "rs")]
+
+
+def _may_match(text: str, literals) -> bool:
+    return literals is None or any(lit in text for lit in literals)
+
+
+class ReceiptParser:
+    """Extracts every receipt field with patterns compiled once at import.
+
+    Output is identical to the original one-``re.search``-per-pattern
+    functions (benchmarks/bench_parser.py checks this): each field's patterns
+    are tried in priority order over the whole text and the first to match
+    wins.  Patterns whose required literals are absent are skipped,
+    and a matched date string is converted by its pattern's own converter
+    instead of trying every strptime format.
+    """
+
+    def __init__(self):
+        self._vendor = [(re.compile(p, re.MULTILINE), lits) for p, lits in zip(VENDOR_PATTERNS, VENDOR_LITERALS)]
+        self._date = [(re.compile(p), lits, convert)
+                      for p, lits, convert in zip(DATE_PATTERNS, DATE_LITERALS, DATE_CONVERTERS)]
+        self._amount = [(re.compile(p, re.IGNORECASE), lits) for p, lits in zip(AMOUNT_PATTERNS, AMOUNT_LITERALS)]
+        self._currency = [(re.compile(p, re.IGNORECASE), lits) for p, lits in zip(CURRENCY_PATTERNS, CURRENCY_LITERALS)]
+
+    def vendor(self, text: str) -> Optional[str]:
+        for pattern, literals in self._vendor:
+            if _may_match(text, literals):
+                match = pattern.search(text)
+                if match:
+                    return match.group(0).strip()
+        for line in text.splitlines():
+            line = line.strip()
+            if line and line.isupper() and len(line) > 5:
+                return line
+        return "Unknown"
+
+    def _date_match(self, text: str):
+        for pattern, literals, convert in self._date:
+            if _may_match(text, literals):
+                match = pattern.search(text)
+                if match:
+                    return match.group(0), convert
+        return None, None
+
+    def date_string(self, text: str) -> Optional[str]:
+        return self._date_match(text)[0]
+
+    def date(self, text: str) -> Optional[date]:
+        date_str, convert = self._date_match(text)
+        return convert(date_str) if date_str else None
+
+    def amount(self, text: str, folded: Optional[str] = None, labelled_only: bool = False) -> Optional[float]:
+        folded = text.casefold() if folded is None else folded
+        # The first pattern is the AMOUNT_LABELS one
+        for pattern, literals in self._amount[:1] if labelled_only else self._amount:
+            if _may_match(folded, literals):
+                match = pattern.search(text)
+                if match:
+                    # Digits and commas only, so this always converts
+                    return float(match.group(1).replace(',', '').replace(' ', ''))
+        return None
+
+    def currency(self, text: str, folded: Optional[str] = None) -> Optional[str]:
+        folded = text.casefold() if folded is None else folded
+        for pattern, literals in self._currency:
+            if _may_match(folded, literals):
+                match = pattern.search(text)
+                if match:
+                    return match.group(1).upper().strip()
+        return None
+
+    def line_items(self, text: str) -> List[Dict]:
+        search = LINE_ITEM_PATTERN.search
+        items = []
+        for line in text.splitlines():
+            # A price needs a decimal point or comma
+            if "." not in line and "," not in line:
                 continue
-    return {
-        "vendor": vendor or "Unknown",
-        "date": date,
-        "amount": amount,
-        "category": category,
-        "currency": currency
-    } 
\ No newline at end of file
+            match = search(line)
+            if match:
+                items.append({'item': match.group(1).strip(),
+                              'price': float(match.group(2).replace(',', '.'))})
+        return items
+
+    def fields(self, text: str) -> Dict:
+        """The parse_receipt_text() fields, without the line items."""
+        folded = text.casefold()
+        vendor = self.vendor(text)
+        return {
+            "vendor": vendor or "Unknown",
+            "date": self.date(text),
+            "amount": self.amount(text, folded),
+            "category": extract_category(vendor),
+            "currency": self.currency(text, folded),
+        }
+
+    def parse(self, text: str) -> Tuple[Dict, List[Dict]]:
+        """Returns ``(parse_receipt_text(text), extract_line_items(text))``."""
+        return self.fields(text), self.line_items(text)
+
+
+_receipt_parser = ReceiptParser()
+
+def parse_receipt(text: str) -> Tuple[Dict, List[Dict]]:
+    """Parsed fields and line items of a receipt."""
+    return _receipt_parser.parse(text)
+
+def parse_receipt_text(text: str) -> Dict:
+    return _receipt_parser.fields(text)
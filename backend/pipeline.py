@@ -0,0 +1,225 @@
+import os
+import time
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException
+from .ocr import extract_text
+from .parser import parse_receipt, extract_labelled_amount, extract_date
+from .db import Receipt, Transaction, LineItem, bump_data_version
+from .queries import TRANSACTION_COLUMNS
+from . import metrics, rollups, store
+
+REQUIRED_FIELDS = ["vendor", "date", "amount", "category"]
+# Stop reading a PDF once the pages read so far contain a labelled total and
+# a date.  Line items on later pages are then lost, and the date can differ
+# from a full read if a later page has one in a format the parser prefers, so
+# this is off by default and such text is not cached.
+PDF_EARLY_STOP = os.environ.get("PDF_EARLY_STOP", "").lower() in ("1", "true", "yes", "on")
+
+
+class _TotalAndDate:
+    """stop_when predicate that remembers whether it stopped the read."""
+
+    def __init__(self):
+        self.fired = False
+
+    def __call__(self, text: str) -> bool:
+        # Only the labelled pattern: the first one the parser tries, so the
+        # amount parsed from these pages is the one a full read would give.
+        # A bare "Rs 120.00" may be an item price ahead of the total.
+        self.fired = extract_labelled_amount(text) is not None and extract_date(text) is not None
+        return self.fired
+
+
+def extract(path: str, ext: str, content_hash: Optional[str] = None) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+    """OCR and parse one stored file.  Raises HTTPException on failure.
+
+    Text already extracted for the same content is reused from the store.
+    """
+    text = store.load_text(content_hash) if content_hash else None
+    if text is None:
+        metrics.inc(metrics.CACHE_MISSES, cache="extracted_text")
+        try:
+            metrics.inc(metrics.BYTES_PROCESSED, os.path.getsize(path), stage="extract_text")
+            # OCR reads the stored file itself rather than a copy in memory
+            stop_when = _TotalAndDate() if PDF_EARLY_STOP else None
+            with metrics.stage("extract_text"):
+                text = extract_text(path, ext, stop_when)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to extract text: {str(e)}")
+        # Text cut short by an early stop is kept out of the cache, which
+        # would otherwise serve it for this content even with the flag off
+        if text and content_hash and not (stop_when and stop_when.fired):
+            store.save_text(content_hash, text)
+    else:
+        metrics.inc(metrics.CACHE_HITS, cache="extracted_text")
+    if not text:
+        raise HTTPException(status_code=400, detail="Could not extract text from file.")
+
+    try:
+        with metrics.stage("parse"):
+            parsed, line_items = parse_receipt(text)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to parse receipt: {str(e)}")
+
+    # Check for required fields
+    for k in REQUIRED_FIELDS:
+        if not parsed.get(k):
+            if k in ("date", "amount"):
+                parsed[k] = None
+            else:
+                parsed[k] = "N/A"
+    return text, parsed, line_items
+
+
+def save(db, filename: str, parsed: Dict[str, Any], line_items: List[Dict[str, Any]],
+         content_hash: Optional[str] = None) -> Tuple[int, int]:
+    """Writes the receipt, its transaction and line items in one commit.
+
+    Returns (receipt_id, transaction_id).  A single commit means a receipt
+    carrying a content hash always has its transaction alongside it.
+    """
+    version = bump_data_version(db)
+    receipt = Receipt(filename=filename, upload_date=date.today(), content_hash=content_hash)
+    db.add(receipt)
+    db.flush()
+    transaction = Transaction(
+        receipt_id=receipt.id,
+        vendor=parsed["vendor"],
+        date=parsed["date"],
+        amount=parsed["amount"],
+        category=parsed["category"],
+        currency=parsed.get("currency"),
+        version=version,
+    )
+    db.add(transaction)
+    db.flush()
+    rollups.record_transactions(db, [parsed], version)
+
+    for li in line_items:
+        db.add(LineItem(transaction_id=transaction.id, item=li['item'], price=li['price']))
+    db.commit()
+    return receipt.id, transaction.id
+
+
+def save_many(db, records: List[Dict[str, Any]]) -> List[Tuple[int, int]]:
+    """Bulk variant of save() for batch uploads.  The caller commits.
+
+    *records* carry ``filename``, ``content_hash``, ``parsed`` and
+    ``line_items``.  Receipts, transactions and line items each go in with
+    one executemany, and the rollups get one upsert per touched group.
+    """
+    version = bump_data_version(db)
+    today = date.today()
+    receipts = [
+        {"filename": r["filename"], "upload_date": today, "content_hash": r.get("content_hash")}
+        for r in records
+    ]
+    db.bulk_insert_mappings(Receipt, receipts, return_defaults=True)
+    transactions = [
+        {
+            "receipt_id": receipt["id"],
+            "vendor": r["parsed"]["vendor"],
+            "date": r["parsed"]["date"],
+            "amount": r["parsed"]["amount"],
+            "category": r["parsed"]["category"],
+            "currency": r["parsed"].get("currency"),
+            "version": version,
+        }
+        for r, receipt in zip(records, receipts)
+    ]
+    db.bulk_insert_mappings(Transaction, transactions, return_defaults=True)
+    db.bulk_insert_mappings(LineItem, [
+        {"transaction_id": t["id"], "item": li["item"], "price": li["price"]}
+        for r, t in zip(records, transactions)
+        for li in r["line_items"]
+    ])
+    rollups.record_transactions(db, [r["parsed"] for r in records], version)
+    return [(receipt["id"], t["id"]) for receipt, t in zip(receipts, transactions)]
+
+
+def existing_result(db, content_hash: str) -> Optional[Dict[str, Any]]:
+    """Rebuilds the upload response for content that is already stored."""
+    row = (
+        db.query(Receipt.filename, *TRANSACTION_COLUMNS)
+        .join(Transaction, Transaction.receipt_id == Receipt.id)
+        .filter(Receipt.content_hash == content_hash)
+        .order_by(Transaction.id)
+        .first()
+    )
+    if row is None:
+        return None
+    items = db.query(LineItem.item, LineItem.price).filter(LineItem.transaction_id == row.id).order_by(LineItem.id)
+    return {
+        "filename": row.filename,
+        "receipt_id": row.receipt_id,
+        "transaction_id": row.id,
+        "message": "This file was uploaded before; returning the stored result.",
+        "duplicate": True,
+        "extracted": {
+            "vendor": row.vendor,
+            "date": row.date.isoformat() if row.date else None,
+            "amount": row.amount,
+            "category": row.category,
+            "currency": row.currency,
+        },
+        "line_items": [{"item": i.item, "price": i.price} for i in items]
+    }
+
+
+def stored_ids(db, hashes: Iterable[str], chunk_size: int = 500) -> Dict[str, Dict[str, int]]:
+    """Maps each already-stored content hash to its receipt and transaction ids."""
+    hashes = list(hashes)
+    found = {}
+    for i in range(0, len(hashes), chunk_size):
+        rows = (
+            db.query(Receipt.content_hash, Receipt.id, Transaction.id)
+            .join(Transaction, Transaction.receipt_id == Receipt.id)
+            .filter(Receipt.content_hash.in_(hashes[i:i + chunk_size]))
+        )
+        for content_hash, receipt_id, transaction_id in rows:
+            found.setdefault(content_hash, {"receipt_id": receipt_id, "transaction_id": transaction_id})
+    return found
+
+
+def stored_result(filename: str, receipt_id: int, transaction_id: int,
+                  parsed: Dict[str, Any], line_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The upload response for a receipt that has just been stored."""
+    parsed = dict(parsed)
+    if parsed.get("date") and hasattr(parsed["date"], "isoformat"):
+        parsed["date"] = parsed["date"].isoformat()
+    return {
+        "filename": filename,
+        "receipt_id": receipt_id,
+        "transaction_id": transaction_id,
+        "message": "File uploaded, parsed, and stored successfully (some fields may be missing).",
+        "extracted": parsed,
+        "line_items": line_items
+    }
+
+
+def _run_extract(path: str, ext: str, content_hash: Optional[str]) -> Dict[str, Any]:
+    try:
+        text, parsed, line_items = extract(path, ext, content_hash)
+        return {"ok": True, "parsed": parsed, "line_items": line_items}
+    except HTTPException as e:
+        return {"ok": False, "status_code": e.status_code, "detail": str(e.detail)}
+    except Exception as e:
+        return {"ok": False, "status_code": 500, "detail": f"Unexpected processing error: {str(e)}"}
+
+
+def run_extract(path: str, ext: str, content_hash: Optional[str] = None,
+                submitted_at: Optional[float] = None) -> Dict[str, Any]:
+    """Worker-process entry point: OCR and parse one stored file.
+
+    Results are written by the API process (see writer.py).  HTTPException
+    does not survive pickling back to the parent, so failures are returned
+    as data instead of raised.  Metrics recorded here travel back under
+    ``"metrics"`` for the API process to merge.
+    """
+    with metrics.captured() as observations:
+        if submitted_at is not None:
+            metrics.observe(metrics.STAGE_SECONDS, time.time() - submitted_at, stage="queue_wait")
+        outcome = _run_extract(path, ext, content_hash)
+    outcome["metrics"] = observations
+    return outcome
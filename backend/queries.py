@@ -0,0 +1,182 @@
+from typing import Optional, Dict, Any, Iterable, List, Tuple
+from sqlalchemy import String, and_, or_, select
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import UnaryExpression, type_coerce
+from .db import Transaction, LineItem
+from .search import match_query, matching_ids
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# The change feed pages through whole tables on a first sync, so allows more
+CHANGES_PAGE_SIZE = 5000
+MAX_CHANGES_PAGE_SIZE = 20000
+
+TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.receipt_id,
+    Transaction.vendor,
+    Transaction.date,
+    Transaction.amount,
+    Transaction.category,
+    Transaction.currency,
+)
+
+# Columns /transactions/sorted/ orders by in SQL
+SORT_COLUMNS = {"date": Transaction.date, "amount": Transaction.amount}
+
+# Related data a transaction listing can embed via include=
+INCLUDES = ("line_items",)
+
+
+def _contains(column, value: str):
+    # Case-insensitive substring match, same semantics as algorithms.linear_search
+    return column.icontains(value, autoescape=True)
+
+
+def apply_transaction_filters(
+    query,
+    vendor: Optional[str] = None,
+    category: Optional[str] = None,
+    keyword: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    amount_min: Optional[float] = None,
+    amount_max: Optional[float] = None,
+):
+    """Adds the /transactions/ filters to *query* as SQL criteria.
+
+    Works on both ``Session.query`` objects and ``select()`` statements.
+    ``keyword`` is matched through the FTS5 index (word prefixes in vendor,
+    category and line items).
+    Dates are compared as ISO strings, exactly like the old in-memory filter,
+    so partial values such as ``2024-05`` keep working and the date index is
+    still used.
+    """
+    if vendor:
+        query = query.filter(_contains(Transaction.vendor, vendor))
+    if category:
+        query = query.filter(_contains(Transaction.category, category))
+    if keyword:
+        fts_query = match_query(keyword)
+        if fts_query is not None:
+            query = query.filter(Transaction.id.in_(matching_ids(fts_query)))
+        else:
+            # Nothing the full-text index can tokenise (e.g. only punctuation)
+            query = query.filter(or_(
+                _contains(Transaction.vendor, keyword),
+                _contains(Transaction.category, keyword),
+            ))
+    if date_from:
+        query = query.filter(type_coerce(Transaction.date, String) >= date_from)
+    if date_to:
+        query = query.filter(type_coerce(Transaction.date, String) <= date_to)
+    if amount_min is not None:
+        query = query.filter(Transaction.amount >= amount_min)
+    if amount_max is not None:
+        query = query.filter(Transaction.amount <= amount_max)
+    return query
+
+
+def keyset(query, limit: int, after: Optional[int] = None):
+    """Keyset pagination on the primary key, for a query or a select().
+
+    Asks for one extra row to find out whether another page exists, so the
+    cost depends on *limit* rather than on the size of the table.
+    """
+    if after is not None:
+        query = query.filter(Transaction.id > after)
+    return query.order_by(Transaction.id).limit(limit + 1)
+
+
+def _without_index(column):
+    # SQLite's unary + changes no value but keeps the planner off the index
+    return UnaryExpression(column.expression, operator=operators.custom_op("+"), type_=column.type)
+
+
+def sorted_parts(query, sort_by: str, descending: bool, limited: bool = True):
+    """*query* ordered like algorithms.timsort, as (valued rows, rows without a value).
+
+    Values run in the requested direction with ties by ascending id, and
+    rows missing the value come after all the others, by id.  Run the parts
+    one after the other: each is a plain scan of the (column, id) or
+    (column DESC, id) index, so a LIMIT stops after k rows, where a single
+    ``ORDER BY column IS NULL`` would sort the whole table.  Without a
+    limit, walking the index costs a table lookup per row and a scan plus
+    SQLite's own sort is quicker, so *limited* False avoids the index.
+    """
+    column = SORT_COLUMNS[sort_by]
+    if not limited:
+        column = _without_index(column)
+    return (
+        query.filter(column.isnot(None)).order_by(column.desc() if descending else column, Transaction.id),
+        query.filter(column.is_(None)).order_by(Transaction.id),
+    )
+
+
+def split_page(rows, limit: int):
+    """Splits the rows fetched by keyset() into the page and the next cursor."""
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def row_to_dict(row) -> Dict[str, Any]:
+    data = dict(row._mapping)
+    if data.get("date"):
+        data["date"] = data["date"].isoformat()
+    return data
+
+
+def parse_includes(include: Optional[str]) -> List[str]:
+    """The comma-separated include= values; raises ValueError on unknown ones."""
+    names = [name.strip() for name in (include or "").split(",") if name.strip()]
+    unknown = sorted(set(names) - set(INCLUDES))
+    if unknown:
+        raise ValueError(f"Unknown include: {', '.join(unknown)}. Supported: {', '.join(INCLUDES)}.")
+    return names
+
+
+def line_items_query(transaction_ids):
+    """Line items of many transactions in one IN query.
+
+    *transaction_ids* is a list of ids or a select() of them.  Rows come back
+    as plain (transaction_id, item, price) tuples in insertion order, which
+    is what selectinload would fetch, minus the ORM objects.
+    """
+    return (
+        select(LineItem.transaction_id, LineItem.item, LineItem.price)
+        .where(LineItem.transaction_id.in_(transaction_ids))
+        .order_by(LineItem.transaction_id, LineItem.id)
+    )
+
+
+def group_line_items(rows, transaction_ids: Iterable[int] = ()) -> Dict[int, List[Dict[str, Any]]]:
+    """Groups line_items_query() rows by transaction; *transaction_ids* start out empty."""
+    grouped: Dict[int, List[Dict[str, Any]]] = {i: [] for i in transaction_ids}
+    for transaction_id, item, price in rows:
+        grouped.setdefault(transaction_id, []).append({"item": item, "price": price})
+    return grouped
+
+
+def parse_change_token(token: Optional[str]) -> Tuple[int, Optional[int]]:
+    """(version, last id) from a change-feed token; no token means from the start.
+
+    A token is ``<version>`` once everything up to that version has been
+    returned, or ``<version>.<id>`` part-way through the rows of a version.
+    Raises ValueError on anything else.
+    """
+    if not token:
+        return -1, None
+    version, _, last_id = token.partition(".")
+    return int(version), (int(last_id) if last_id else None)
+
+
+def change_token(version: int, last_id: Optional[int] = None) -> str:
+    return str(version) if last_id is None else f"{version}.{last_id}"
+
+
+def changes_query(query, since: int, after_id: Optional[int], upto: int):
+    """Rows of *query* changed after (since, after_id), up to version *upto*, in feed order."""
+    newer = Transaction.version > since
+    if after_id is not None:
+        newer = or_(newer, and_(Transaction.version == since, Transaction.id > after_id))
+    return query.filter(newer, Transaction.version <= upto).order_by(Transaction.version, Transaction.id)
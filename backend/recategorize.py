@@ -0,0 +1,142 @@
+"""Set-based recategorisation of stored transactions.
+
+Each distinct vendor is classified once and categories are rewritten with
+batched ``UPDATE ... WHERE vendor IN (...)`` statements on a background
+thread.  The pass is skipped when the fingerprint of the category rules
+stored in ``app_meta`` matches the running code.
+"""
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import or_
+from .db import SessionLocal, Transaction, AppMeta, bump_data_version
+from .parser import extract_category, category_rules_fingerprint
+from . import rollups
+
+FINGERPRINT_KEY = "category_rules_fingerprint"
+BATCH_SIZE = int(os.environ.get("RECATEGORIZE_BATCH_SIZE", 500))
+
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_state: Dict[str, Any] = {
+    "status": "idle",
+    "started_at": None,
+    "finished_at": None,
+    "vendors_total": 0,
+    "vendors_done": 0,
+    "updated": 0,
+    "error": None,
+}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _set(**fields) -> None:
+    with _lock:
+        _state.update(fields)
+
+
+def status() -> Dict[str, Any]:
+    with _lock:
+        return dict(_state)
+
+
+def stored_fingerprint(db) -> Optional[str]:
+    row = db.get(AppMeta, FINGERPRINT_KEY)
+    return row.value if row else None
+
+
+def _vendor_filter(vendors: List[Optional[str]]):
+    named = [v for v in vendors if v is not None]
+    criteria = Transaction.vendor.in_(named)
+    if len(named) != len(vendors):
+        criteria = or_(criteria, Transaction.vendor.is_(None))
+    return criteria
+
+
+def _apply_batch(db, vendors: List[Optional[str]], category: str) -> int:
+    """Moves every row of *vendors* into *category*, refreshing the affected rollups."""
+    stale = or_(Transaction.category != category, Transaction.category.is_(None))
+    criteria = [_vendor_filter(vendors), stale]
+    old = {
+        rollups.UNKNOWN_KEY if c is None else c
+        for (c,) in db.query(Transaction.category).filter(*criteria).distinct()
+    }
+    if not old:
+        return 0
+    version = bump_data_version(db)
+    updated = (
+        db.query(Transaction)
+        .filter(*criteria)
+        .update({Transaction.category: category, Transaction.version: version}, synchronize_session=False)
+    )
+    rollups.refresh_groups(db, "category", old | {category})
+    return updated
+
+
+def run(force: bool = False) -> Dict[str, Any]:
+    """Recategorises every transaction if the rules changed (or *force*)."""
+    fingerprint = category_rules_fingerprint()
+    db = SessionLocal()
+    try:
+        if not force and stored_fingerprint(db) == fingerprint:
+            # Sketches of databases from before they existed are filled in here
+            rollups.refresh_sketches(db)
+            db.commit()
+            _set(status="up_to_date", finished_at=_now())
+            return status()
+
+        vendors = [v for (v, ) in db.query(Transaction.vendor).distinct()]
+        _set(vendors_total=len(vendors))
+        by_category = defaultdict(list)
+        for vendor in vendors:
+            by_category[extract_category(vendor)].append(vendor)
+
+        done = 0
+        for category, group in by_category.items():
+            for i in range(0, len(group), BATCH_SIZE):
+                batch = group[i:i + BATCH_SIZE]
+                updated = _apply_batch(db, batch, category)
+                db.commit()
+                done += len(batch)
+                with _lock:
+                    _state["vendors_done"] = done
+                    _state["updated"] += updated
+
+        # Rows no longer move, so the sketches of the groups they left or joined can be rebuilt
+        rollups.refresh_sketches(db)
+        db.merge(AppMeta(key=FINGERPRINT_KEY, value=fingerprint))
+        db.commit()
+        _set(status="done", finished_at=_now())
+        return status()
+    except Exception as e:
+        db.rollback()
+        _set(status="failed", finished_at=_now(), error=str(e))
+        raise
+    finally:
+        db.close()
+
+
+def _run_quietly(force: bool) -> None:
+    try:
+        run(force)
+    except Exception:
+        # Already recorded in the status for /maintenance/recategorize/
+        pass
+
+
+def start(force: bool = False) -> Dict[str, Any]:
+    """Starts a background pass unless one is already running."""
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return dict(_state)
+        _state.update(status="running", started_at=_now(), finished_at=None,
+                      vendors_total=0, vendors_done=0, updated=0, error=None)
+        _thread = threading.Thread(target=_run_quietly, args=(force,), name="recategorize", daemon=True)
+        _thread.start()
+        return dict(_state)
@@ -0,0 +1,635 @@
+"""Incrementally maintained per-month, per-vendor and per-category summaries.
+
+Every write path that inserts or recategorises transactions updates the
+rollup tables in the same DB transaction, so /transactions/stats/ reads its
+counts, sums, extremes and totals from O(#groups) rows instead of rescanning
+``transactions``.  The exact median and mode are not kept up to date: each
+still costs one pass over the amount index (see read_stats()).
+
+Month and category groups also have mergeable sketches (sketches.py) of
+their amounts and vendors in ``rollup_sketches``, updated with the same
+writes, from which the approximate stats mode merges the groups a request
+covers.
+"""
+import argparse
+import calendar
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import String, and_, bindparam, func, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.sql.expression import type_coerce
+from .db import (
+    SessionLocal, Transaction, MonthlyRollup, VendorRollup, CategoryRollup, RollupSketch, bump_data_version,
+)
+from .queries import apply_transaction_filters
+from .sketches import TransactionSketch, rank_error
+
+UNKNOWN_KEY = "Unknown"
+
+ROLLUP_MODELS = {
+    "month": MonthlyRollup,
+    "vendor": VendorRollup,
+    "category": CategoryRollup,
+}
+
+SUMMARY_FIELDS = ("count", "amount_count", "amount_sum", "amount_sumsq", "amount_min", "amount_max")
+
+# Groups that keep a TransactionSketch; vendors are the long tail being sketched
+SKETCH_KINDS = ("month", "category")
+SKETCH_BATCH_ROWS = int(os.environ.get("SKETCH_BATCH_ROWS", 10000))
+# Vendors listed by approximate stats when top_n is not given
+STATS_TOP_N = int(os.environ.get("STATS_TOP_N", 20))
+QUANTILES = {"p25": 0.25, "p75": 0.75, "p90": 0.9, "p99": 0.99}
+
+# Decoded sketches from the last update of each group, with the text that was
+# stored.  When the previous data version was the last commit to write them,
+# they are exactly what is stored and are updated without a read; otherwise a
+# group whose stored text still matches is at least not parsed again.
+_sketch_lock = threading.Lock()
+_sketch_cache: Dict[Tuple[str, str], Tuple[str, TransactionSketch]] = {}
+_sketch_cache_version: Optional[int] = None
+
+
+def month_key(value) -> Optional[str]:
+    if not value:
+        return None
+    return str(value)[:7]
+
+
+def _group_keys(txn: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    return {
+        "month": month_key(txn.get("date")),
+        "vendor": UNKNOWN_KEY if txn.get("vendor") is None else txn["vendor"],
+        "category": UNKNOWN_KEY if txn.get("category") is None else txn["category"],
+    }
+
+
+def _group_expr(kind: str):
+    if kind == "month":
+        return func.substr(type_coerce(Transaction.date, String), 1, 7)
+    column = Transaction.vendor if kind == "vendor" else Transaction.category
+    return func.coalesce(column, UNKNOWN_KEY)
+
+
+def _key_filter(kind: str, keys: List[str]):
+    if kind == "month":
+        return _group_expr(kind).in_(keys)
+    column = Transaction.vendor if kind == "vendor" else Transaction.category
+    # Filter on the bare column so its index is used
+    criteria = column.in_(keys)
+    if UNKNOWN_KEY in keys:
+        criteria = or_(criteria, column.is_(None))
+    return criteria
+
+
+def _empty_summary() -> Dict[str, Any]:
+    return {"count": 0, "amount_count": 0, "amount_sum": 0.0, "amount_sumsq": 0.0,
+            "amount_min": None, "amount_max": None}
+
+
+def record_transactions(db, transactions: Iterable[Dict[str, Any]], version: Optional[int] = None) -> None:
+    """Adds newly inserted transactions to the rollups.
+
+    Contributions are combined per group first, and each rollup table gets
+    one executemany upsert for all its touched groups.  *version* is the data
+    version the caller's commit bumped to.  The caller commits.
+    """
+    global _sketch_cache_version
+    deltas = {kind: defaultdict(_empty_summary) for kind in ROLLUP_MODELS}
+    batches = {kind: defaultdict(lambda: ([], [])) for kind in SKETCH_KINDS}
+    for txn in transactions:
+        amount = txn.get("amount")
+        keys = _group_keys(txn)
+        for kind, key in keys.items():
+            if key is None:
+                continue
+            d = deltas[kind][key]
+            d["count"] += 1
+            if amount is not None:
+                d["amount_count"] += 1
+                d["amount_sum"] += amount
+                d["amount_sumsq"] += amount * amount
+                d["amount_min"] = amount if d["amount_min"] is None else min(d["amount_min"], amount)
+                d["amount_max"] = amount if d["amount_max"] is None else max(d["amount_max"], amount)
+            if kind in batches:
+                vendors, amounts = batches[kind][key]
+                vendors.append(keys["vendor"])
+                amounts.append(amount)
+
+    for kind, groups in deltas.items():
+        if groups:
+            db.execute(_UPSERTS[kind], [{"key": key, **d} for key, d in groups.items()])
+    with _sketch_lock:
+        # Every change to the data bumps the version, so if nothing committed
+        # since our last write, the cached sketches are the stored ones
+        trusted = version is not None and _sketch_cache_version == version - 1
+        _sketch_cache_version = None
+        upserts = []
+        for kind, groups in batches.items():
+            if groups:
+                upserts.extend(_update_sketches(db, kind, groups, trusted))
+        # Month and category sketches share a table: one executemany for both
+        if upserts:
+            db.execute(_SKETCH_UPSERT, upserts)
+        _sketch_cache_version = version
+
+
+def _update_sketches(db, kind: str, batches: Dict[str, Tuple[List[str], List[Optional[float]]]],
+                     trusted: bool) -> List[Dict[str, Any]]:
+    """Adds the batches to the cached or stored sketches and returns their upsert rows."""
+    unknown = [key for key in batches if not (trusted and (kind, key) in _sketch_cache)]
+    stored = {}
+    if unknown:
+        stored = {
+            key: (group_count, sketch_count, text)
+            for key, group_count, sketch_count, text in db.execute(_SKETCH_READS[kind], {"keys": unknown})
+        }
+    upserts = []
+    for key, (vendors, amounts) in batches.items():
+        if key in stored:
+            group_count, sketch_count, text = stored[key]
+            # group_count already includes this batch
+            if (sketch_count or 0) != group_count - len(vendors):
+                # Stale sketch: refresh_sketches() rebuilds it whole
+                _sketch_cache.pop((kind, key), None)
+                continue
+            cached = _sketch_cache.get((kind, key))
+            if cached is not None and cached[0] == text:
+                sketch = cached[1]
+            else:
+                sketch = TransactionSketch.loads(text) if text is not None else TransactionSketch()
+        else:
+            sketch = _sketch_cache[(kind, key)][1]
+        sketch.update(vendors, amounts)
+        text = sketch.dumps()
+        _sketch_cache[(kind, key)] = (text, sketch)
+        upserts.append({"kind": kind, "key": key, "count": sketch.vendors.n, "sketch": text})
+    return upserts
+
+
+def _upsert(model):
+    """INSERT ... ON CONFLICT that adds a delta row to the stored summary."""
+    stmt = sqlite_insert(model)
+    new = stmt.excluded
+    return stmt.on_conflict_do_update(index_elements=[model.key], set_={
+        "count": model.count + new.count,
+        "amount_count": model.amount_count + new.amount_count,
+        "amount_sum": model.amount_sum + new.amount_sum,
+        "amount_sumsq": model.amount_sumsq + new.amount_sumsq,
+        # Either side may be NULL (no amounts yet, or none in the delta)
+        "amount_min": func.min(func.coalesce(model.amount_min, new.amount_min),
+                               func.coalesce(new.amount_min, model.amount_min)),
+        "amount_max": func.max(func.coalesce(model.amount_max, new.amount_max),
+                               func.coalesce(new.amount_max, model.amount_max)),
+    })
+
+
+# Built once; every batch reuses the same compiled statement with executemany
+_UPSERTS = {kind: _upsert(model) for kind, model in ROLLUP_MODELS.items()}
+
+
+def _sketch_join(kind: str):
+    model = ROLLUP_MODELS[kind]
+    return and_(RollupSketch.kind == kind, RollupSketch.key == model.key)
+
+
+_SKETCH_READS = {
+    kind: select(ROLLUP_MODELS[kind].key, ROLLUP_MODELS[kind].count, RollupSketch.count, RollupSketch.sketch)
+    .outerjoin(RollupSketch, _sketch_join(kind))
+    .where(ROLLUP_MODELS[kind].key.in_(bindparam("keys", expanding=True)))
+    for kind in SKETCH_KINDS
+}
+_sketch_insert = sqlite_insert(RollupSketch)
+_SKETCH_UPSERT = _sketch_insert.on_conflict_do_update(
+    index_elements=[RollupSketch.kind, RollupSketch.key],
+    set_={"count": _sketch_insert.excluded.count, "sketch": _sketch_insert.excluded.sketch},
+)
+
+
+def _summarise(db, kind: str, keys: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    expr = _group_expr(kind)
+    query = db.query(
+        expr,
+        func.count(),
+        func.count(Transaction.amount),
+        func.coalesce(func.sum(Transaction.amount), 0.0),
+        func.coalesce(func.sum(Transaction.amount * Transaction.amount), 0.0),
+        func.min(Transaction.amount),
+        func.max(Transaction.amount),
+    ).filter(expr.isnot(None))
+    if keys is not None:
+        query = query.filter(_key_filter(kind, keys))
+    return {row[0]: dict(zip(SUMMARY_FIELDS, row[1:])) for row in query.group_by(expr)}
+
+
+def _build_sketches(db, kind: str, keys: Optional[List[str]] = None) -> Dict[str, TransactionSketch]:
+    """Sketches of the given groups (all by default), read from the raw table in batches."""
+    expr = _group_expr(kind)
+    stmt = select(expr, func.coalesce(Transaction.vendor, UNKNOWN_KEY), Transaction.amount).where(expr.isnot(None))
+    if keys is not None:
+        stmt = stmt.where(_key_filter(kind, keys))
+    sketches = defaultdict(TransactionSketch)
+    for rows in db.execute(stmt.execution_options(yield_per=SKETCH_BATCH_ROWS)).partitions():
+        groups = defaultdict(lambda: ([], []))
+        for key, vendor, amount in rows:
+            vendors, amounts = groups[key]
+            vendors.append(vendor)
+            amounts.append(amount)
+        for key, (vendors, amounts) in groups.items():
+            sketches[key].update(vendors, amounts)
+    return sketches
+
+
+def refresh_groups(db, kind: str, keys: Iterable[str]) -> None:
+    """Recomputes the given groups from the raw table.
+
+    Used when rows move between groups (recategorisation), where a running
+    min/max cannot be decremented.  Their sketches are left stale (a row
+    cannot be taken out of one either); refresh_sketches() rebuilds them once
+    the moves are done.  The caller commits.
+    """
+    keys = [k for k in set(keys) if k is not None]
+    if not keys:
+        return
+    model = ROLLUP_MODELS[kind]
+    fresh = _summarise(db, kind, keys)
+    db.query(model).filter(model.key.in_(keys)).delete(synchronize_session=False)
+    for key, summary in fresh.items():
+        db.add(model(key=key, **summary))
+    if kind in SKETCH_KINDS:
+        # Rows can move in and out with the count unchanged, so drop them outright
+        db.query(RollupSketch).filter(RollupSketch.kind == kind, RollupSketch.key.in_(keys)) \
+            .delete(synchronize_session=False)
+        with _sketch_lock:
+            for key in keys:
+                _sketch_cache.pop((kind, key), None)
+    db.flush()
+
+
+def rebuild(db) -> Dict[str, int]:
+    """Regenerates every rollup table from ``transactions``.  The caller commits."""
+    counts = {}
+    db.query(RollupSketch).delete(synchronize_session=False)
+    for kind, model in ROLLUP_MODELS.items():
+        db.query(model).delete(synchronize_session=False)
+        fresh = _summarise(db, kind)
+        db.bulk_insert_mappings(model, [dict(key=k, **v) for k, v in fresh.items()])
+        if kind in SKETCH_KINDS:
+            db.bulk_insert_mappings(RollupSketch, [
+                {"kind": kind, "key": k, "count": sketch.vendors.n, "sketch": sketch.dumps()}
+                for k, sketch in _build_sketches(db, kind).items()
+            ])
+        counts[kind] = len(fresh)
+    db.flush()
+    bump_data_version(db)
+    return counts
+
+
+def refresh_sketches(db) -> int:
+    """Rebuilds stale sketches from ``transactions``; returns how many.  The caller commits."""
+    rebuilt = 0
+    for kind in SKETCH_KINDS:
+        model = ROLLUP_MODELS[kind]
+        stale = {
+            key for (key,) in db.query(model.key).outerjoin(RollupSketch, _sketch_join(kind))
+            .filter(or_(RollupSketch.count.is_(None), RollupSketch.count != model.count))
+        }
+        if not stale:
+            continue
+        # Databases from before the sketches existed: one pass over the table
+        everything = len(stale) == db.query(model.key).count()
+        fresh = _build_sketches(db, kind, None if everything else list(stale))
+        upserts = [
+            {"kind": kind, "key": key, "count": sketch.vendors.n, "sketch": sketch.dumps()}
+            for key, sketch in fresh.items() if key in stale
+        ]
+        if not upserts:
+            continue
+        db.execute(_SKETCH_UPSERT, upserts)
+        # Now holding the write lock: a group that gained rows since it was
+        # read stays stale until the next refresh
+        group_count = select(model.count).where(model.key == RollupSketch.key).scalar_subquery()
+        outdated = db.query(RollupSketch).filter(
+            RollupSketch.kind == kind, RollupSketch.key.in_(list(stale)), RollupSketch.count != group_count,
+        ).delete(synchronize_session=False)
+        rebuilt += len(upserts) - outdated
+    if rebuilt:
+        # Approximate stats answered by streaming until now come from the sketches
+        bump_data_version(db)
+    return rebuilt
+
+
+def _close(a, b) -> bool:
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def check(db) -> Dict[str, Any]:
+    """Compares the rollup tables against a fresh aggregation of ``transactions``."""
+    mismatches = []
+    for kind, model in ROLLUP_MODELS.items():
+        expected = _summarise(db, kind)
+        actual = {
+            r.key: {f: getattr(r, f) for f in SUMMARY_FIELDS}
+            for r in db.query(model).all()
+        }
+        for key in sorted(set(expected) | set(actual)):
+            exp, act = expected.get(key), actual.get(key)
+            if exp is None or act is None or not all(_close(exp[f], act[f]) for f in SUMMARY_FIELDS):
+                mismatches.append({"rollup": kind, "key": key, "expected": exp, "actual": act})
+    stale = []
+    for kind in SKETCH_KINDS:
+        model = ROLLUP_MODELS[kind]
+        rows = db.query(model.key, model.count, model.amount_count, RollupSketch.count, RollupSketch.sketch) \
+            .outerjoin(RollupSketch, _sketch_join(kind))
+        for key, count, amount_count, sketch_count, text in rows:
+            if sketch_count != count:
+                stale.append({"rollup": kind, "key": key})
+                continue
+            sketch = TransactionSketch.loads(text)
+            if (sketch.vendors.n, sketch.amounts.n) != (count, amount_count):
+                mismatches.append({
+                    "rollup": kind, "key": key,
+                    "expected": {"count": count, "amount_count": amount_count},
+                    "actual": {"sketch_count": sketch.vendors.n, "sketch_amount_count": sketch.amounts.n},
+                })
+    return {"consistent": not mismatches, "mismatches": mismatches, "stale_sketches": stale}
+
+
+def is_empty(db) -> bool:
+    return db.query(CategoryRollup.key).first() is None
+
+
+def _exact_median(db, n: int) -> float:
+    # Walks the amount index up to the middle (O(n), but without reading the
+    # table or materialising every amount in Python)
+    rows = (
+        db.query(Transaction.amount)
+        .filter(Transaction.amount.isnot(None))
+        .order_by(Transaction.amount)
+        .offset((n - 1) // 2)
+        .limit(2 - n % 2)
+        .all()
+    )
+    values = [r[0] for r in rows]
+    return sum(values) / len(values)
+
+
+def _exact_mode(db) -> Optional[float]:
+    # One grouped pass over the amount index.  statistics.mode returns the
+    # first value seen among equally common ones
+    row = (
+        db.query(Transaction.amount)
+        .filter(Transaction.amount.isnot(None))
+        .group_by(Transaction.amount)
+        .order_by(func.count().desc(), func.min(Transaction.id))
+        .first()
+    )
+    return row[0] if row else None
+
+
+def read_stats(db) -> Dict[str, Any]:
+    """Builds the /transactions/stats/ payload for the unfiltered case from the rollups.
+
+    Everything except the median and mode comes from the summary rows; those
+    two each scan the amount index once.  approx=true avoids both scans.
+    """
+    categories = db.query(CategoryRollup).all()
+    vendors = db.query(VendorRollup).all()
+    months = db.query(MonthlyRollup).filter(MonthlyRollup.amount_count > 0).order_by(MonthlyRollup.key).all()
+
+    n = sum(r.amount_count for r in categories)
+    total = sum(r.amount_sum for r in categories)
+    if n:
+        sumsq = sum(r.amount_sumsq for r in categories)
+        stats = {
+            "sum": total,
+            "mean": total / n,
+            "median": _exact_median(db, n),
+            "mode": _exact_mode(db) if n > 1 else None,
+            "min": min(r.amount_min for r in categories if r.amount_min is not None),
+            "max": max(r.amount_max for r in categories if r.amount_max is not None),
+            "stddev": math.sqrt(max(sumsq / n - (total / n) ** 2, 0.0)),
+        }
+    else:
+        stats = {"sum": 0, "mean": 0, "median": 0, "mode": None, "min": None, "max": None, "stddev": None}
+    stats["count"] = n
+    stats["vendor_frequency"] = {r.key: r.count for r in vendors}
+    stats["category_frequency"] = {r.key: r.count for r in categories}
+    stats["monthly_totals"] = {r.key: r.amount_sum for r in months}
+    return stats
+
+
+_MONTH = re.compile(r"\d{4}-\d{2}")
+_DAY = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def whole_months(date_from: Optional[str], date_to: Optional[str]) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """First and last month of a date filter that covers whole months only, else None."""
+    if date_from and not (_MONTH.fullmatch(date_from) or (_DAY.fullmatch(date_from) and date_from.endswith("-01"))):
+        return None
+    if date_to:
+        # Dates compare as strings, so "2024-03" as an upper bound excludes all of March
+        if not _DAY.fullmatch(date_to):
+            return None
+        year, month, day = (int(part) for part in date_to.split("-"))
+        if not 1 <= month <= 12 or day < calendar.monthrange(year, month)[1]:
+            return None
+    return (date_from[:7] if date_from else None, date_to[:7] if date_to else None)
+
+
+def _approx_payload(n: int, total: float, sumsq: float, low: Optional[float], high: Optional[float],
+                    sketch: TransactionSketch, top_n: int) -> Dict[str, Any]:
+    """Exact moments plus sketched median, mode, quantiles and top vendors, with their error bounds."""
+    if n:
+        median, *rest = sketch.amounts.quantiles([0.5, *QUANTILES.values()])
+        common = sketch.values.top(2)
+        # Only an amount that provably occurs more often than any other is a mode:
+        # its lower bound must beat every other amount's upper bound outright
+        runner_up = max(sketch.values.floor(), common[1][1] if len(common) > 1 else 0)
+        stats = {
+            "sum": total,
+            "mean": total / n,
+            "median": median,
+            "mode": common[0][0] if n > 1 and common and common[0][1] - common[0][2] > runner_up else None,
+            "min": low,
+            "max": high,
+            "stddev": math.sqrt(max(sumsq / n - (total / n) ** 2, 0.0)),
+            "quantiles": dict(zip(QUANTILES, rest)),
+        }
+    else:
+        stats = {"sum": 0, "mean": 0, "median": 0, "mode": None, "min": None, "max": None, "stddev": None,
+                 "quantiles": dict.fromkeys(QUANTILES)}
+    stats["count"] = n
+    ranked = sketch.vendors.top(top_n + 1)
+    listed = ranked[:top_n]
+    stats["vendor_frequency"] = {vendor: count for vendor, count, _ in listed}
+    stats["error_bounds"] = {
+        # Returned quantiles are within this fraction of count of the requested rank
+        "quantile_rank_error": rank_error(sketch.amounts.k),
+        # Listed counts are upper bounds and exceed the true count by at most this
+        "vendor_frequency_overcount": max((error for _, _, error in listed), default=0),
+        # No vendor left out of vendor_frequency occurs more often than this
+        "unlisted_vendor_max": max(sketch.vendors.floor(), ranked[top_n][1] if len(ranked) > top_n else 0),
+    }
+    return stats
+
+
+def _group_totals(groups) -> Tuple[int, float, float, Optional[float], Optional[float]]:
+    lows = [g.amount_min for g in groups if g.amount_min is not None]
+    highs = [g.amount_max for g in groups if g.amount_max is not None]
+    return (
+        sum(g.amount_count for g in groups),
+        sum(g.amount_sum for g in groups),
+        sum(g.amount_sumsq for g in groups),
+        min(lows) if lows else None,
+        max(highs) if highs else None,
+    )
+
+
+def _category_monthly_totals(db, categories: List[str]) -> Dict[str, float]:
+    if not categories:
+        return {}
+    expr = _group_expr("month")
+    query = (
+        db.query(expr, func.sum(Transaction.amount))
+        .filter(Transaction.category.in_(categories), expr.isnot(None), Transaction.amount.isnot(None))
+        .group_by(expr)
+        .order_by(expr)
+    )
+    return {month: total for month, total in query}
+
+
+def _filtered_category_counts(db, **filters) -> Dict[str, int]:
+    expr = _group_expr("category")
+    query = apply_transaction_filters(db.query(expr, func.count()), **filters).group_by(expr)
+    return {category: count for category, count in query}
+
+
+def load_approx_groups(db, category: Optional[str] = None, date_from: Optional[str] = None,
+                       date_to: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """The stored sketches and exact totals of the groups a stats request covers.
+
+    Answers the unfiltered case, a category filter, or a date range of whole
+    months; returns None when the filter does not select whole groups or a
+    selected group's sketch is stale, and the caller streams the rows instead.
+    Only reads: decoding and merging the sketches is left to approx_stats().
+    """
+    months = None
+    kind = "category"
+    if category:
+        if date_from or date_to:
+            return None
+        groups = db.query(CategoryRollup).filter(CategoryRollup.key.icontains(category, autoescape=True)).all()
+        # "Unknown" also holds rows without a category, which the filter never matches
+        if any(g.key == UNKNOWN_KEY for g in groups):
+            return None
+    elif date_from or date_to:
+        months = whole_months(date_from, date_to)
+        if months is None:
+            return None
+        kind = "month"
+        query = db.query(MonthlyRollup)
+        if months[0]:
+            query = query.filter(MonthlyRollup.key >= months[0])
+        if months[1]:
+            query = query.filter(MonthlyRollup.key <= months[1])
+        groups = query.order_by(MonthlyRollup.key).all()
+    else:
+        # Every transaction is in exactly one category group, dated or not
+        groups = db.query(CategoryRollup).all()
+    stored = {
+        key: (count, text)
+        for key, count, text in db.query(RollupSketch.key, RollupSketch.count, RollupSketch.sketch)
+        .filter(RollupSketch.kind == kind, RollupSketch.key.in_([g.key for g in groups]))
+    }
+    if any(stored.get(g.key, (None, None))[0] != g.count for g in groups):
+        return None
+
+    loaded = {"totals": _group_totals(groups), "sketches": [stored[g.key][1] for g in groups]}
+    if months is not None:
+        loaded["category_frequency"] = _filtered_category_counts(db, date_from=date_from, date_to=date_to)
+        loaded["monthly_totals"] = {g.key: g.amount_sum for g in groups if g.amount_count}
+    elif category:
+        loaded["category_frequency"] = {g.key: g.count for g in groups}
+        loaded["monthly_totals"] = _category_monthly_totals(db, [g.key for g in groups])
+    else:
+        loaded["category_frequency"] = {g.key: g.count for g in groups}
+        loaded["monthly_totals"] = {
+            r.key: r.amount_sum
+            for r in db.query(MonthlyRollup).filter(MonthlyRollup.amount_count > 0).order_by(MonthlyRollup.key)
+        }
+    return loaded
+
+
+def approx_stats(loaded: Dict[str, Any], top_n: int) -> Dict[str, Any]:
+    """Approximate /transactions/stats/ payload from load_approx_groups(); CPU only, no DB access."""
+    sketch = TransactionSketch()
+    for text in loaded["sketches"]:
+        sketch.merge(TransactionSketch.loads(text))
+    stats = _approx_payload(*loaded["totals"], sketch, top_n)
+    stats["category_frequency"] = loaded["category_frequency"]
+    stats["monthly_totals"] = loaded["monthly_totals"]
+    return stats
+
+
+class StatsAccumulator:
+    """Approximate stats of (vendor, date, amount, category) rows fed in batches, in bounded memory."""
+
+    def __init__(self):
+        self.sketch = TransactionSketch()
+        self.n = 0
+        self.total = 0.0
+        self.sumsq = 0.0
+        self.low: Optional[float] = None
+        self.high: Optional[float] = None
+        self.categories: Counter = Counter()
+        self.months: Dict[str, float] = defaultdict(float)
+
+    def add(self, rows) -> None:
+        vendors, amounts = [], []
+        for vendor, day, amount, category in rows:
+            vendors.append(UNKNOWN_KEY if vendor is None else vendor)
+            self.categories[UNKNOWN_KEY if category is None else category] += 1
+            if amount is None:
+                continue
+            amounts.append(amount)
+            month = month_key(day)
+            if month:
+                self.months[month] += amount
+        self.sketch.update(vendors, amounts)
+        if amounts:
+            self.n += len(amounts)
+            self.total += sum(amounts)
+            self.sumsq += sum(a * a for a in amounts)
+            self.low = min(amounts) if self.low is None else min(self.low, min(amounts))
+            self.high = max(amounts) if self.high is None else max(self.high, max(amounts))
+
+    def result(self, top_n: int) -> Dict[str, Any]:
+        stats = _approx_payload(self.n, self.total, self.sumsq, self.low, self.high, self.sketch, top_n)
+        stats["category_frequency"] = dict(self.categories)
+        stats["monthly_totals"] = dict(sorted(self.months.items()))
+        return stats
+
+
+if __name__ == "__main__":
+    # python -m backend.rollups rebuild|check
+    cli = argparse.ArgumentParser(description="Maintain the transaction rollup tables.")
+    cli.add_argument("command", choices=["rebuild", "check"])
+    args = cli.parse_args()
+    session = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(rebuild(session))
+            session.commit()
+        else:
+            report = check(session)
+            print(report)
+            raise SystemExit(0 if report["consistent"] else 1)
+    finally:
+        session.close()
@@ -0,0 +1,69 @@
+"""Keyword search backed by the SQLite FTS5 index ``transactions_fts``.
+
+Keywords match whole words or word prefixes in the vendor, category and
+line-item text of a transaction, ranked with BM25.
+"""
+import argparse
+import re
+from typing import Optional
+from sqlalchemy import Float, Integer, column, text
+from .db import SessionLocal, FTS_TABLE, FTS_POPULATE_SQL, bump_data_version
+
+# BM25 column weights: vendor, category, line items
+RANK_WEIGHTS = (4.0, 2.0, 1.0)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def match_query(keyword: str) -> Optional[str]:
+    """Turns free text into an FTS5 query: every word must match as a prefix.
+
+    Returns None when the keyword has no word characters to search for.
+    """
+    tokens = _TOKEN.findall(keyword.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def matching_ids(query: str):
+    """SELECT of the transaction ids matching an FTS query, usable with ``in_()``."""
+    return (
+        text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query")
+        .bindparams(fts_query=query)
+        .columns(column("rowid", Integer))
+    )
+
+
+def ranked_matches(query: str):
+    """Subquery of (id, rank) for matching transactions; lower rank is more relevant."""
+    weights = ", ".join(str(w) for w in RANK_WEIGHTS)
+    return (
+        text(f"SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS rank "
+             f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query")
+        .bindparams(fts_query=query)
+        .columns(column("id", Integer), column("rank", Float))
+        .subquery("fts_rank")
+    )
+
+
+def rebuild(db) -> int:
+    """Repopulates the index from ``transactions`` and ``line_items``.  The caller commits."""
+    db.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    db.execute(text(FTS_POPULATE_SQL))
+    db.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    bump_data_version(db)
+    return db.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+
+if __name__ == "__main__":
+    # python -m backend.search rebuild
+    cli = argparse.ArgumentParser(description="Maintain the transaction full-text index.")
+    cli.add_argument("command", choices=["rebuild"])
+    cli.parse_args()
+    session = SessionLocal()
+    try:
+        print({"indexed": rebuild(session)})
+        session.commit()
+    finally:
+        session.close()
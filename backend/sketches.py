@@ -0,0 +1,265 @@
+"""Mergeable summaries behind the approximate /transactions/stats/ mode.
+
+``KllSketch`` answers quantile queries over a stream of numbers in
+O(k log(n/k)) space (Karnin, Lang & Liberty, 2016).  A quantile it returns
+has a rank within ``rank_error(k)`` * n of the requested one, with 99%
+confidence; at the default k=200 that is about 1.3% of the count.
+
+``SpaceSaving`` keeps the heaviest items of a stream in a fixed number of
+counters (Metwally, Agrawal & El Abbadi, 2005).  Every reported count is an
+upper bound on the true one and overstates it by at most that item's
+``error``; an item that is not reported occurs at most ``floor()`` times.
+Both are at most n / capacity.
+
+Both merge: combining the sketches of two groups gives a sketch of their
+union with the same guarantees, so per-month and per-category sketches can
+be stored once and combined per request.  ``TransactionSketch`` bundles the
+ones kept for a group of transactions and is stored as JSON.
+"""
+import base64
+import heapq
+import json
+import math
+import os
+import random
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+KLL_K = int(os.environ.get("SKETCH_KLL_K", 200))
+VENDOR_COUNTERS = int(os.environ.get("SKETCH_VENDOR_COUNTERS", 256))
+VALUE_COUNTERS = int(os.environ.get("SKETCH_VALUE_COUNTERS", 64))
+
+# Level capacities shrink geometrically by this factor towards the bottom
+_KLL_C = 2 / 3
+# Compaction phases come from a fixed seed, so merging the same stored
+# sketches gives the same answer on every request
+_KLL_SEED = 0
+
+
+def _pack(typecode: str, values: List) -> str:
+    # Numbers are stored as base64 arrays: formatting hundreds of them as JSON
+    # dominated the cost of writing a sketch back on every insert
+    return base64.b64encode(array(typecode, values).tobytes()).decode()
+
+
+def _unpack(typecode: str, text: str) -> List:
+    return array(typecode, base64.b64decode(text)).tolist()
+
+
+def rank_error(k: int = KLL_K) -> float:
+    """Normalised rank error of a KllSketch, at 99% confidence.
+
+    Empirical fit for this compaction scheme, as published with the Apache
+    DataSketches KLL implementation.
+    """
+    return 2.296 / k ** 0.9723
+
+
+class KllSketch:
+    """Quantiles of a stream of numbers; items at level h stand for 2**h inputs."""
+
+    def __init__(self, k: int = KLL_K):
+        self.k = k
+        self.n = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.levels: List[List[float]] = [[]]
+        self._random = random.Random(_KLL_SEED)
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return int(math.ceil(self.k * _KLL_C ** depth)) + 1
+
+    def _compress(self) -> None:
+        # Lazy: compact only the lowest level that is over its capacity
+        for h, items in enumerate(self.levels):
+            if len(items) < self._capacity(h):
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append([])
+                self._max_size = sum(self._capacity(i) for i in range(len(self.levels)))
+            items.sort()
+            # Keep the smallest item back when the count is odd, then promote
+            # every other item (random phase) at twice the weight
+            odd = len(items) % 2
+            self.levels[h + 1].extend(items[odd + self._random.getrandbits(1)::2])
+            self.levels[h] = items[:odd]
+            self._size = sum(len(level) for level in self.levels)
+            return
+
+    def update(self, values: Iterable[float]) -> None:
+        values = [float(v) for v in values]
+        if not values:
+            return
+        self.n += len(values)
+        low, high = min(values), max(values)
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        i = 0
+        while i < len(values):
+            room = self._max_size - self._size
+            self.levels[0].extend(values[i:i + room])
+            taken = min(room, len(values) - i)
+            self._size += taken
+            i += taken
+            if self._size >= self._max_size:
+                self._compress()
+
+    def merge(self, other: "KllSketch") -> None:
+        if other.k != self.k:
+            raise ValueError(f"cannot merge KLL sketches with k={self.k} and k={other.k}")
+        if not other.n:
+            return
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._size = sum(len(level) for level in self.levels)
+        self._max_size = sum(self._capacity(i) for i in range(len(self.levels)))
+        while self._size >= self._max_size:
+            self._compress()
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """Approximate values at the given ranks (0..1); None while empty."""
+        if not self.n:
+            return [None for _ in qs]
+        weighted = sorted((v, 1 << h) for h, items in enumerate(self.levels) for v in items)
+        total = sum(w for _, w in weighted)
+        out = []
+        for q in qs:
+            if q <= 0:
+                out.append(self.min)
+                continue
+            if q >= 1:
+                out.append(self.max)
+                continue
+            target, seen = q * total, 0
+            for value, weight in weighted:
+                seen += weight
+                if seen >= target:
+                    break
+            out.append(value)
+        return out
+
+    def quantile(self, q: float) -> Optional[float]:
+        return self.quantiles([q])[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        levels = [_pack("d", level) for level in self.levels]
+        return {"k": self.k, "n": self.n, "min": self.min, "max": self.max, "levels": levels}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KllSketch":
+        sketch = cls(data["k"])
+        sketch.n, sketch.min, sketch.max = data["n"], data["min"], data["max"]
+        sketch.levels = [_unpack("d", level) for level in data["levels"]]
+        sketch._size = sum(len(level) for level in sketch.levels)
+        sketch._max_size = sum(sketch._capacity(i) for i in range(len(sketch.levels)))
+        return sketch
+
+
+class SpaceSaving:
+    """The heaviest items of a stream, in at most *capacity* (count, error) counters."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.n = 0
+        self.counters: Dict[Any, Tuple[int, int]] = {}
+
+    def floor(self) -> int:
+        """Upper bound on the count of any item without a counter."""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(self.counters.values())[0]
+
+    def _combine(self, counters: Dict[Any, Tuple[int, int]], floor: int, n: int) -> None:
+        # An item missing from one side may have been evicted there, so it is
+        # credited that side's floor as both count and error; then only the
+        # heaviest *capacity* counters are kept (Cafaro et al., 2016)
+        own_floor = self.floor()
+        combined = {}
+        for item in self.counters.keys() | counters.keys():
+            count_a, error_a = self.counters.get(item, (own_floor, own_floor))
+            count_b, error_b = counters.get(item, (floor, floor))
+            combined[item] = (count_a + count_b, error_a + error_b)
+        if len(combined) > self.capacity:
+            combined = dict(heapq.nlargest(self.capacity, combined.items(), key=lambda kv: kv[1][0]))
+        self.counters = combined
+        self.n += n
+
+    def update(self, items: Iterable[Any]) -> None:
+        # The batch is counted exactly and merged in place: the same result as
+        # _combine() with an exact summary, without rebuilding every counter
+        counts = Counter(items)
+        if not counts:
+            return
+        floor = self.floor()
+        for item, c in counts.items():
+            count, error = self.counters.get(item, (floor, floor))
+            self.counters[item] = (count + c, error)
+        self.n += sum(counts.values())
+        excess = len(self.counters) - self.capacity
+        if excess > 0:
+            for item in heapq.nsmallest(excess, self.counters, key=self.counters.__getitem__):
+                del self.counters[item]
+
+    def merge(self, other: "SpaceSaving") -> None:
+        self._combine(other.counters, other.floor(), other.n)
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[Any, int, int]]:
+        """(item, count, error) for the *n* heaviest items, heaviest first."""
+        ranked = sorted(self.counters.items(), key=lambda kv: -kv[1][0])
+        return [(item, count, error) for item, (count, error) in ranked[:n]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        counts = [count for count, _ in self.counters.values()]
+        errors = [error for _, error in self.counters.values()]
+        return {"capacity": self.capacity, "n": self.n, "items": list(self.counters),
+                "counts": _pack("q", counts), "errors": _pack("q", errors)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        summary = cls(data["capacity"])
+        summary.n = data["n"]
+        summary.counters = dict(zip(data["items"], zip(_unpack("q", data["counts"]), _unpack("q", data["errors"]))))
+        return summary
+
+
+class TransactionSketch:
+    """Sketches of one group of transactions: amount quantiles and modes, and vendor counts."""
+
+    def __init__(self):
+        self.amounts = KllSketch()
+        self.values = SpaceSaving(VALUE_COUNTERS)
+        self.vendors = SpaceSaving(VENDOR_COUNTERS)
+
+    def update(self, vendors: Iterable[str], amounts: Iterable[Optional[float]]) -> None:
+        """Adds one batch of rows: a vendor for every row, amounts where known."""
+        self.vendors.update(vendors)
+        amounts = [a for a in amounts if a is not None]
+        self.amounts.update(amounts)
+        self.values.update(amounts)
+
+    def merge(self, other: "TransactionSketch") -> None:
+        self.amounts.merge(other.amounts)
+        self.values.merge(other.values)
+        self.vendors.merge(other.vendors)
+
+    def dumps(self) -> str:
+        return json.dumps({"amounts": self.amounts.to_dict(), "values": self.values.to_dict(),
+                           "vendors": self.vendors.to_dict()}, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, text: str) -> "TransactionSketch":
+        data = json.loads(text)
+        sketch = cls()
+        sketch.amounts = KllSketch.from_dict(data["amounts"])
+        sketch.values = SpaceSaving.from_dict(data["values"])
+        sketch.vendors = SpaceSaving.from_dict(data["vendors"])
+        return sketch
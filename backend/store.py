@@ -0,0 +1,85 @@
+"""Content-addressed storage for uploaded files and their extracted text.
+
+Objects are keyed by the SHA-256 of their bytes, so re-uploading a bill
+never writes a second copy or overwrites a different file of the same name.
+"""
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional, Tuple
+from . import metrics
+
+STORE_DIR = os.environ.get("RECEIPT_STORE_DIR", os.path.join(os.path.dirname(__file__), '../data/store'))
+CHUNK_SIZE = 1024 * 1024
+
+
+class TooLarge(ValueError):
+    """Raised by ingest() once a source grows past its size limit."""
+
+
+def object_path(digest: str, ext: str) -> str:
+    return os.path.join(STORE_DIR, "objects", digest[:2], digest + ext)
+
+
+def text_path(digest: str) -> str:
+    return os.path.join(STORE_DIR, "text", digest[:2], digest + ".txt")
+
+
+def _tmp_file() -> Tuple[int, str]:
+    tmp_dir = os.path.join(STORE_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tempfile.mkstemp(dir=tmp_dir)
+
+
+def _publish(tmp: str, final: str) -> None:
+    if os.path.exists(final):
+        os.remove(tmp)
+        return
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    os.replace(tmp, final)
+
+
+def ingest(src: BinaryIO, ext: str, max_bytes: Optional[int] = None) -> Tuple[str, str]:
+    """Copies *src* into the store, hashing it chunk by chunk.
+
+    Returns ``(sha256_hex, path)``.  If the object is already stored the new
+    copy is discarded.  With *max_bytes*, the copy stops and TooLarge is
+    raised as soon as the source is longer than that; nothing is kept.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = _tmp_file()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise TooLarge(f"more than {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+        final = object_path(digest.hexdigest(), ext)
+        _publish(tmp, final)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    metrics.inc(metrics.BYTES_PROCESSED, size, stage="store_write")
+    return digest.hexdigest(), final
+
+
+def load_text(digest: str) -> Optional[str]:
+    try:
+        with open(text_path(digest), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def save_text(digest: str, text: str) -> None:
+    fd, tmp = _tmp_file()
+    with os.fdopen(fd, "w", encoding="utf-8") as out:
+        out.write(text)
+    _publish(tmp, text_path(digest))
@@ -3,14 +3,15 @@ from fastapi import UploadFile, HTTPException
 
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.pdf', '.txt'}
 MAX_FILE_SIZE_MB = 10
+MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+FILE_TOO_LARGE = f"File size exceeds {MAX_FILE_SIZE_MB} MB limit."
 
 
 def validate_file(file: UploadFile):
     ext = os.path.splitext(file.filename)[1].lower()
     if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}")
-    file.file.seek(0, os.SEEK_END)
-    size_mb = file.file.tell() / (1024 * 1024)
-    file.file.seek(0)
-    if size_mb > MAX_FILE_SIZE_MB:
-        raise HTTPException(status_code=400, detail=f"File size exceeds {MAX_FILE_SIZE_MB} MB limit.") 
\ No newline at end of file
+    # Starlette counts the bytes while spooling the upload, so there is no need
+    # to seek through the file; store.ingest enforces the limit when it is unknown
+    if file.size is not None and file.size > MAX_FILE_SIZE_BYTES:
+        raise HTTPException(status_code=413, detail=FILE_TOO_LARGE)
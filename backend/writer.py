@@ -0,0 +1,131 @@
+"""Single writer thread that group-commits parsed uploads.
+
+OCR and parsing run on the worker pool, but every upload is written here, in
+the API process: the writer takes whatever is pending, waits up to
+GROUP_COMMIT_MS for more to arrive, inserts the lot with save_many() and
+commits once.  One writer means uploads never queue on SQLite's write lock
+against each other, and a burst of N uploads costs one commit instead of N.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+from .db import SessionLocal
+from .pipeline import existing_result, save_many, stored_ids, stored_result
+from . import metrics
+
+GROUP_COMMIT_MS = float(os.environ.get("GROUP_COMMIT_MS", 5))
+GROUP_COMMIT_MAX = int(os.environ.get("GROUP_COMMIT_MAX", 256))
+
+_STOP = object()
+_queue: "queue.Queue" = queue.Queue()
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+
+def submit(filename: str, content_hash: Optional[str], parsed: Dict[str, Any],
+           line_items: List[Dict[str, Any]]) -> Future:
+    """Queues one parsed upload for writing.
+
+    The future resolves to the upload response: a fresh receipt, or the
+    stored one (``"duplicate": True``) when the same content is already in
+    the database or earlier in the same group.
+    """
+    future = Future()
+    record = {"filename": filename, "content_hash": content_hash, "parsed": parsed, "line_items": line_items}
+    _ensure_started()
+    _queue.put((record, future))
+    return future
+
+
+def _ensure_started() -> None:
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="db-writer", daemon=True)
+            _thread.start()
+
+
+def shutdown(timeout: float = 10) -> None:
+    """Writes whatever is still queued, then stops the writer thread."""
+    global _thread
+    with _lock:
+        thread, _thread = _thread, None
+    if thread is not None:
+        _queue.put(_STOP)
+        thread.join(timeout)
+
+
+def _next_group() -> Tuple[List[Tuple[Dict[str, Any], Future]], bool]:
+    """Blocks for the next upload, then gathers more for up to GROUP_COMMIT_MS."""
+    first = _queue.get()
+    if first is _STOP:
+        return [], True
+    group = [first]
+    deadline = time.monotonic() + GROUP_COMMIT_MS / 1000
+    while len(group) < GROUP_COMMIT_MAX:
+        remaining = deadline - time.monotonic()
+        try:
+            item = _queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _STOP:
+            return group, True
+        group.append(item)
+    return group, False
+
+
+def _run() -> None:
+    stopping = False
+    while not stopping:
+        group, stopping = _next_group()
+        if group:
+            _write_group(group)
+
+
+def _save(db, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    stored = stored_ids(db, {r["content_hash"] for r in records if r["content_hash"]})
+    fresh, seen = [], set()
+    for r in records:
+        h = r["content_hash"]
+        if h and (h in stored or h in seen):
+            continue
+        if h:
+            seen.add(h)
+        fresh.append(r)
+    saved = {}
+    if fresh:
+        saved = {id(r): ids for r, ids in zip(fresh, save_many(db, fresh))}
+    db.commit()
+    results = []
+    for r in records:
+        if id(r) in saved:
+            receipt_id, transaction_id = saved[id(r)]
+            results.append(stored_result(r["filename"], receipt_id, transaction_id, r["parsed"], r["line_items"]))
+        else:
+            results.append(existing_result(db, r["content_hash"]))
+    return results
+
+
+def _write_group(group: List[Tuple[Dict[str, Any], Future]]) -> None:
+    db = SessionLocal()
+    try:
+        with metrics.stage("db_write"):
+            results = _save(db, [record for record, _ in group])
+        error = None
+    except Exception as e:
+        db.rollback()
+        error = e
+    finally:
+        db.close()
+    if error is None:
+        for (_, future), result in zip(group, results):
+            future.set_result(result)
+    elif len(group) > 1:
+        # Retry one by one so a bad record only fails itself
+        for item in group:
+            _write_group([item])
+    else:
+        group[0][1].set_exception(error)
@@ -0,0 +1,177 @@
+"""Times the FastAPI endpoints in-process against a seeded database of a given size.
+
+    python -m benchmarks.bench_api --rows 100000 [--seed 0] [--repeat 5] [--db-dir DIR]
+
+Seeded databases are kept in *--db-dir* and reused by later runs with the
+same size and seed.  The database location is set through RECEIPT_DB_PATH
+before the backend is imported, so this runs as its own process per size
+(benchmarks.run starts one for each).  Prints one JSON object on stdout.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from benchmarks import corpus
+from benchmarks.timing import measure, skipped
+
+SEED_KEY = "benchmark_seed"
+DEFAULT_DB_DIR = os.path.join(tempfile.gettempdir(), "intellij-bench")
+
+
+def _log(message: str) -> None:
+    print(message, file=sys.stderr, flush=True)
+
+
+def _seeded_as(path: str):
+    if not os.path.exists(path):
+        return None
+    try:
+        with sqlite3.connect(path) as conn:
+            row = conn.execute("SELECT value FROM app_meta WHERE key = ?", (SEED_KEY,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+
+def _seed(rows: int, seed: int, tag: str) -> None:
+    from sqlalchemy import insert
+    from backend.db import engine, SessionLocal, Receipt, Transaction, LineItem, AppMeta
+    from backend.parser import category_rules_fingerprint
+    from backend import recategorize, rollups
+
+    started = time.perf_counter()
+    item_id = 0
+    with engine.begin() as conn:
+        for chunk in corpus.transaction_rows(rows, seed):
+            receipts, transactions, items = [], [], []
+            for r in chunk:
+                row_id = r["number"] + 1
+                receipts.append({
+                    "id": row_id, "filename": f"bench-{row_id}.txt", "upload_date": r["date"],
+                    "content_hash": hashlib.sha256(f"{seed}:{row_id}".encode()).hexdigest(),
+                })
+                transactions.append({
+                    "id": row_id, "receipt_id": row_id, "vendor": r["vendor"], "date": r["date"],
+                    "amount": r["amount"], "category": r["category"], "currency": r["currency"],
+                })
+                for name, price in r["items"]:
+                    item_id += 1
+                    items.append({"id": item_id, "transaction_id": row_id, "item": name, "price": price})
+            conn.execute(insert(Receipt.__table__), receipts)
+            conn.execute(insert(Transaction.__table__), transactions)
+            conn.execute(insert(LineItem.__table__), items)
+            _log(f"  seeded {chunk[-1]['number'] + 1}/{rows}")
+    db = SessionLocal()
+    try:
+        rollups.rebuild(db)
+        # Category rules are current, so startup has nothing to recategorise
+        db.merge(AppMeta(key=recategorize.FINGERPRINT_KEY, value=category_rules_fingerprint()))
+        db.merge(AppMeta(key=SEED_KEY, value=tag))
+        db.commit()
+    finally:
+        db.close()
+    _log(f"  seeding took {time.perf_counter() - started:.1f}s")
+
+
+def _cases(rows: int):
+    """(name, method, path, params); the middle of the table is used for cursors."""
+    middle = max(1, rows // 2)
+    return [
+        ("list_first_page", "get", "/transactions/", {"limit": 100}),
+        ("list_deep_page", "get", "/transactions/", {"limit": 100, "after": middle}),
+        ("list_vendor", "get", "/transactions/", {"vendor": "Walmart", "limit": 100}),
+        ("list_keyword", "get", "/transactions/", {"keyword": "airtel", "limit": 100}),
+        ("list_line_item_keyword", "get", "/transactions/", {"keyword": "router", "limit": 100}),
+        ("list_date_range", "get", "/transactions/",
+         {"date_from": "2024-03-01", "date_to": "2024-03-31", "limit": 100}),
+        ("list_amount_range", "get", "/transactions/", {"amount_min": 100, "amount_max": 200, "limit": 100}),
+        ("sorted_vendor_amount", "get", "/transactions/sorted/",
+         {"vendor": "Walmart", "sort_by": "amount", "order": "desc"}),
+        ("sorted_relevance", "get", "/transactions/sorted/", {"keyword": "tata power", "sort_by": "relevance"}),
+        ("sorted_newest", "get", "/transactions/sorted/", {"sort_by": "date", "order": "desc", "limit": 100}),
+        ("sorted_top_amount", "get", "/transactions/sorted/", {"sort_by": "amount", "order": "desc", "limit": 100}),
+        ("stats_rollups", "get", "/transactions/stats/", {}),
+        ("stats_vendor", "get", "/transactions/stats/", {"vendor": "Walmart"}),
+        ("stats_month", "get", "/transactions/stats/", {"date_from": "2024-03-01", "date_to": "2024-03-31"}),
+        ("stats_approx", "get", "/transactions/stats/", {"approx": "true"}),
+        ("stats_approx_category", "get", "/transactions/stats/", {"category": "Electricity", "approx": "true"}),
+        ("line_items", "get", f"/transactions/{middle}/items/", {}),
+    ]
+
+
+# Cases that touch every row and are only worth timing on the smaller tables
+FULL_SCAN_CASES = [
+    ("sorted_all_by_date", "get", "/transactions/sorted/", {"sort_by": "date"}),
+    ("rollups_check", "get", "/maintenance/rollups/check/", {}),
+]
+FULL_SCAN_MAX_ROWS = 100000
+
+
+def _upload(client, seed: int):
+    counter = iter(range(10 ** 9))
+
+    def upload():
+        # A new receipt every time, so the job really runs instead of deduplicating
+        text = corpus.receipt_text(corpus.receipts(1, seed=seed * 10 ** 6 + next(counter))[0])
+        text += f"\nRef {time.time_ns()}"
+        response = client.post("/upload/", files={"file": ("bench.txt", text.encode(), "text/plain")})
+        if response.status_code == 202:
+            job_id = response.json()["job_id"]
+            while response.status_code == 202:
+                time.sleep(0.005)
+                response = client.get(f"/jobs/{job_id}/result")
+        if response.status_code != 200:
+            raise RuntimeError(f"upload failed: {response.status_code} {response.text[:200]}")
+    return upload
+
+
+def run(rows: int, seed: int = 0, repeat: int = 5, db_dir: str = DEFAULT_DB_DIR):
+    os.makedirs(db_dir, exist_ok=True)
+    path = os.path.join(db_dir, f"bench_{rows}_{seed}.db")
+    tag = f"{rows}:{seed}"
+    fresh = _seeded_as(path) != tag
+    if fresh and os.path.exists(path):
+        os.remove(path)
+    os.environ["RECEIPT_DB_PATH"] = path
+    os.environ["RECEIPT_STORE_DIR"] = os.path.join(db_dir, f"store_{rows}_{seed}")
+    if fresh:
+        _log(f"seeding {rows} rows into {path}")
+        _seed(rows, seed, tag)
+
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    cases = _cases(rows) + (FULL_SCAN_CASES if rows <= FULL_SCAN_MAX_ROWS else [])
+    results = {}
+    with TestClient(app) as client:
+        for name, method, url, params in cases:
+            def call():
+                response = getattr(client, method)(url, params=params)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{response.status_code} {response.text[:200]}")
+            try:
+                results[name] = measure(call, repeat=repeat)
+            except Exception as e:
+                results[name] = skipped(f"failed: {e}")
+            _log(f"  {name}: {results[name]}")
+        try:
+            # The warm-up upload also starts the worker processes
+            results["upload_txt"] = measure(_upload(client, seed), repeat=repeat)
+        except Exception as e:
+            results["upload_txt"] = skipped(f"failed: {e}")
+        _log(f"  upload_txt: {results['upload_txt']}")
+    return {f"api.{rows}.{name}": result for name, result in results.items()}
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--rows", type=int, required=True)
+    cli.add_argument("--seed", type=int, default=0)
+    cli.add_argument("--repeat", type=int, default=5)
+    cli.add_argument("--db-dir", default=DEFAULT_DB_DIR)
+    args = cli.parse_args()
+    print(json.dumps(run(args.rows, args.seed, args.repeat, args.db_dir)))
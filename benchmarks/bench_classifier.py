@@ -0,0 +1,81 @@
+"""Compares the compiled vendor classifier with the original per-key regex loop.
+
+    python -m benchmarks.bench_classifier [--n 1000000] [--seed 0]
+
+Checks that both give identical categories for every generated vendor string
+and reports the time each takes, with the memo cache cold and warm.
+"""
+import argparse
+import random
+import time
+from backend.parser import VENDOR_CATEGORY_MAP, VendorClassifier
+
+NOISE_WORDS = ["store", "market", "pvt ltd", "bill", "invoice", "#1042", "online", "power", "broadband",
+               "branch", "mumbai", "delhi", "supercenter", "express", "services", "limited"]
+
+
+def legacy_extract_category(vendor):
+    # Verbatim copy of parser.extract_category before the classifier was introduced
+    if vendor:
+        vend_low = vendor.lower()
+        import re as _re
+        for v, cat in VENDOR_CATEGORY_MAP.items():
+            pattern = rf"\b{_re.escape(v.lower())}\b"
+            if _re.search(pattern, vend_low):
+                return cat
+
+        if any(k in vend_low for k in ("electricity", "power", "bijli", "discom")):
+            return "Electricity"
+        if any(k in vend_low for k in ("internet", "broadband", "fibernet")):
+            return "Internet"
+    return "Other"
+
+
+def vendor_strings(n, seed=0, distinct=50000):
+    """*n* vendor strings drawn from a pool of *distinct* realistic variants."""
+    rnd = random.Random(seed)
+    vendors = list(VENDOR_CATEGORY_MAP)
+    pool = []
+    for _ in range(distinct):
+        words = rnd.sample(NOISE_WORDS, rnd.randint(0, 3))
+        if rnd.random() < 0.8:
+            words.insert(rnd.randint(0, len(words)), rnd.choice(vendors))
+        name = " ".join(words) or "Unknown"
+        name = rnd.choice([str.upper, str.title, str.lower, str])(name)
+        pool.append(name)
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def _time(fn, values):
+    start = time.perf_counter()
+    out = [fn(v) for v in values]
+    return time.perf_counter() - start, out
+
+
+def run(n=1000000, seed=0):
+    values = vendor_strings(n, seed)
+    legacy_s, expected = _time(legacy_extract_category, values)
+    cold = VendorClassifier(VENDOR_CATEGORY_MAP, cache_size=0)
+    cold_s, got_cold = _time(cold.classify, values)
+    warm = VendorClassifier(VENDOR_CATEGORY_MAP)
+    warm_s, got_warm = _time(warm.classify, values)
+    mismatches = sum(1 for a, b, c in zip(expected, got_cold, got_warm) if not (a == b == c))
+    return {
+        "n": n,
+        "legacy_s": round(legacy_s, 3),
+        "compiled_s": round(cold_s, 3),
+        "compiled_cached_s": round(warm_s, 3),
+        "speedup": round(legacy_s / cold_s, 1),
+        "speedup_cached": round(legacy_s / warm_s, 1),
+        "mismatches": mismatches,
+    }
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--n", type=int, default=1000000)
+    cli.add_argument("--seed", type=int, default=0)
+    args = cli.parse_args()
+    result = run(args.n, args.seed)
+    print(result)
+    raise SystemExit(1 if result["mismatches"] else 0)
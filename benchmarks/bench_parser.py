@@ -0,0 +1,248 @@
+"""Checks the compiled receipt parser against the original extract_* chain.
+
+    python -m benchmarks.bench_parser [--n 20000] [--seed 0] [--repeat 3]
+
+The regression corpus is a fixed list of awkward receipts (fields split over
+line breaks, every date layout, carriage returns, no vendor line) plus *n*
+randomly assembled ones.  Every text must give identical fields and line
+items from both parsers; per-receipt parse times are reported for each.
+"""
+import argparse
+import random
+import re
+import time
+from datetime import datetime
+from typing import Optional
+from backend.parser import (
+    AMOUNT_PATTERNS, CURRENCY_PATTERNS, DATE_PATTERNS, VENDOR_CATEGORY_MAP, VENDOR_PATTERNS,
+    extract_category, parse_receipt,
+)
+
+
+# Verbatim copies of the parser functions before ReceiptParser was introduced
+
+def legacy_extract_vendor(text: str) -> Optional[str]:
+   
+    for pattern in VENDOR_PATTERNS:
+        match = re.search(pattern, text, re.MULTILINE)
+        if match:
+            return match.group(0).strip()
+   
+    for line in text.splitlines():
+        if line.strip() and line.strip().isupper() and len(line.strip()) > 5:
+            return line.strip()
+    return "Unknown"
+
+
+def legacy_extract_date(text: str) -> Optional[str]:
+    for pattern in DATE_PATTERNS:
+        match = re.search(pattern, text)
+        if match:
+            return match.group(0)
+    return None
+
+
+def legacy_extract_amount(text: str) -> Optional[float]:
+    for pattern in AMOUNT_PATTERNS:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            try:
+                return float(match.group(1).replace(',', '').replace(' ', ''))
+            except (ValueError, IndexError):
+                continue
+    return None
+
+
+def legacy_extract_currency(text: str) -> Optional[str]:
+    for pattern in CURRENCY_PATTERNS:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(1).upper().strip()
+    return None
+
+
+def legacy_extract_line_items(text: str):
+    items = []
+    pattern = re.compile(r"([A-Za-z0-9 \-]+)\s+(\d+[\.,]\d{2})")
+    for line in text.splitlines():
+        match = pattern.search(line)
+        if match:
+            item = match.group(1).strip()
+            price = float(match.group(2).replace(',', '.'))
+            items.append({'item': item, 'price': price})
+    return items
+
+
+def legacy_parse_receipt_text(text):
+    vendor = legacy_extract_vendor(text)
+    date_str = legacy_extract_date(text)
+    amount = legacy_extract_amount(text)
+    currency = legacy_extract_currency(text)
+    category = extract_category(vendor)
+
+    date = None
+    if date_str:
+        for fmt in (
+            "%d-%m-%Y",
+            "%d/%m/%Y",
+            "%m/%d/%Y",
+            "%Y-%m-%d",
+            "%B %d, %Y",
+            "%b %d, %Y",
+            "%d %b %Y",
+            "%d %B %Y",
+            "%d-%b-%Y",
+            "%d-%B-%Y",
+            "%b %d %Y",
+            "%B %d %Y",
+        ):
+            try:
+                date = datetime.strptime(date_str, fmt).date()
+                break
+            except ValueError:
+                continue
+    return {
+        "vendor": vendor or "Unknown",
+        "date": date,
+        "amount": amount,
+        "category": category,
+        "currency": currency
+    }
+
+
+def legacy_parse(text):
+    return legacy_parse_receipt_text(text), legacy_extract_line_items(text)
+
+
+EDGE_CASES = [
+    "",
+    "\n\n",
+    "     \nTotal 5.00",
+    "hello world",
+    "Acme Pvt.\nLtd. Mumbai\nTotal 10.00",
+    "Acme LLP Pvt.\nLtd\nBill",
+    "Shree Traders Co.\nLtd.\nAmount Due",
+    "Sharma Pvt.\n\nLtd.",
+    "Total\n\n\n   1,234.50",
+    "Grand Total:\n------------------\n99.99",
+    "amount payable -\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n12",
+    "Rs.\n\n   450",
+    "paid 450\n\n  ₹ done",
+    "Qty 2\nrs",
+    "Hours 5 and 10 Rs",
+    "Date: 31-02-2024\nTotal 1.00",
+    "12/31/2024 and 2024-01-05",
+    "12/05-2024\n2024/05/06",
+    "2024/05/06",
+    "Sept 5, 2024\n5 Sept 2024",
+    "Marchx 5, 2024",
+    "March 0, 2024",
+    "20 Apr-2024",
+    "20-April-2024",
+    "Apr-20 2024\nApr 20 2024",
+    "Jun 31 2024",
+    "May 5,2024",
+    "ACME STORE!\r\nTotal\r\n 12.00\r\nMilk 2.50\r\nBread 1,25",
+    "a\x0bWALMART SUPERCENTER!\x0cEggs 3.10 Tax 0.20",
+    "ÄPFEL STORE\nSum 7",
+    "Invoice\nACT Fibernet services\nAmount 799.00 INR\n01/02/2024",
+    "Vodafone Idea\nTotal amount\n₹ 1,499.00\nrm",
+    "Foo Inc\\x Bar LLC",
+    "Rſ 250\nſum 3",
+    "ınr 12",
+]
+
+VENDOR_LINES = list(VENDOR_CATEGORY_MAP) + [
+    "QUICK MART", "Acme Pvt. Ltd.", "Acme Pvt.", "Sunrise Traders LLP", "Blue Hills Co. Ltd.",
+    "Foo Inc.", "Bar LLC", "Corner Store", "KAMAR SDN BHD", "city electricity board",
+    "Global Company", "nothing here",
+]
+DATE_STRINGS = [
+    "{d:02d}-{m:02d}-{y}", "{d:02d}/{m:02d}/{y}", "{m:02d}/{d:02d}/{y}", "{y}-{m:02d}-{d:02d}",
+    "{y}/{m:02d}/{d:02d}", "{mon} {d}, {y}", "{month} {d}, {y}", "{d} {mon} {y}", "{d}-{month}-{y}",
+    "{d} {mon}-{y}", "{mon} {d} {y}", "{month}-{d}-{y}", "{mon} {d},{y}", "Sept {d} {y}",
+]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August",
+          "September", "October", "November", "December"]
+AMOUNT_LINES = [
+    "Total {a}", "TOTAL AMOUNT: {a}", "Amount Due", "{a}", "Grand Total", "Balance ---- {a}",
+    "Rs. {a}", "₹{a}", "{a} Rs", "{a} ₹", "Subtotal {a}", "Sum:", "paid {a}",
+]
+FILLER_LINES = [
+    "Thank you for shopping", "GSTIN 27AAACR5055K1Z7", "Tel: 022-555-0101", "Invoice No 10442",
+    "Cashier: 04", "USD", "EUR", "£", "RM", "INR", "$", "", "   ", "-----", "Visit again!",
+    "Meter No. 55012 Units 230", "Bill Period", "CUSTOMER COPY", "Form 16",
+]
+ITEMS = ["Milk", "Bread", "Eggs 12", "Rice 5kg", "Tea-Leaves", "Data Pack", "Energy Charges", "Fixed Charges"]
+
+
+def _amount(rnd):
+    value = rnd.choice([rnd.randint(1, 99), rnd.randint(100, 99999)])
+    text = rnd.choice(["{:.2f}", "{:,.2f}", "{:.0f}"]).format(value + rnd.randint(0, 99) / 100)
+    # Some receipts use a decimal comma
+    return text.replace(".", ",") if rnd.random() < 0.1 else text
+
+
+def random_receipt(rnd):
+    lines = []
+    for _ in range(rnd.randint(0, 3)):
+        lines.append(rnd.choice(FILLER_LINES))
+    vendor = rnd.choice(VENDOR_LINES)
+    lines.append(rnd.choice([str.upper, str.title, str])(vendor))
+    month = rnd.randint(1, 12)
+    fields = {"d": rnd.randint(0, 32), "m": month, "y": rnd.choice([2023, 2024, 2025]),
+              "mon": MONTHS[month - 1][:3], "month": MONTHS[month - 1]}
+    for _ in range(rnd.randint(0, 2)):
+        lines.append("Date: " + rnd.choice(DATE_STRINGS).format(**fields))
+    for _ in range(rnd.randint(0, 8)):
+        lines.append(f"{rnd.choice(ITEMS)} {_amount(rnd)}")
+    for _ in range(rnd.randint(0, 6)):
+        lines.append(rnd.choice(FILLER_LINES))
+    for _ in range(rnd.randint(0, 2)):
+        lines.append(rnd.choice(AMOUNT_LINES).format(a=_amount(rnd)))
+        if rnd.random() < 0.3:
+            lines.append(_amount(rnd))
+    if rnd.random() < 0.2:
+        rnd.shuffle(lines)
+    return rnd.choice(["\n", "\n", "\n", "\r\n", "\n\n"]).join(lines)
+
+
+def corpus(n, seed=0):
+    rnd = random.Random(seed)
+    return EDGE_CASES + [random_receipt(rnd) for _ in range(n)]
+
+
+def _time(fn, texts, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = [fn(t) for t in texts]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def run(n=20000, seed=0, repeat=3):
+    texts = corpus(n, seed)
+    legacy_s, expected = _time(legacy_parse, texts, repeat)
+    compiled_s, got = _time(parse_receipt, texts, repeat)
+    mismatches = [t for t, a, b in zip(texts, expected, got) if a != b]
+    return {
+        "receipts": len(texts),
+        "legacy_us_per_receipt": round(legacy_s / len(texts) * 1e6, 1),
+        "compiled_us_per_receipt": round(compiled_s / len(texts) * 1e6, 1),
+        "speedup": round(legacy_s / compiled_s, 2),
+        "mismatches": len(mismatches),
+        "first_mismatch": mismatches[0] if mismatches else None,
+    }
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--n", type=int, default=20000)
+    cli.add_argument("--seed", type=int, default=0)
+    cli.add_argument("--repeat", type=int, default=3)
+    args = cli.parse_args()
+    result = run(args.n, args.seed, args.repeat)
+    print(result)
+    raise SystemExit(1 if result["mismatches"] else 0)
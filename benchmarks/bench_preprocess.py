@@ -0,0 +1,106 @@
+"""OCR image preprocessing: the current pipeline against the previous one.
+
+    python -m benchmarks.bench_preprocess [--files 10] [--repeat 5] [--seed 0]
+
+The reference corpus is rendered receipts saved as PNG scans and as
+phone-photo-like JPEGs at several sizes.  Each stage of the new pipeline
+(decode + downsample, threshold, auto-crop) is timed on its own, and so is
+the whole of each pipeline.  When Tesseract is installed, both outputs are
+also OCRed and scored against the text the receipts were rendered from;
+otherwise the accuracy entries are reported as skipped.  Prints JSON.
+"""
+import argparse
+import difflib
+import io
+import json
+from typing import Any, Callable, Dict, List
+from PIL import Image, ImageFilter
+from benchmarks import corpus
+from benchmarks.timing import measure, skipped
+from backend import ocr
+
+PHOTO_SCALES = (2, 4, 8)
+
+
+def legacy_preprocess(image: Image.Image) -> Image.Image:
+    """The pipeline before resolution normalisation, kept for comparison."""
+    image = image.convert('L')
+    image = image.point(lambda x: 0 if x < 140 else 255, '1')
+    image = image.filter(ImageFilter.SHARPEN)
+    return image
+
+
+def reference_corpus(files: int, seed: int) -> Dict[str, List[bytes]]:
+    texts = corpus.texts(files, seed)
+    sets = {"png_scan": [corpus.render_png(t) for t in texts]}
+    for scale in PHOTO_SCALES:
+        sets[f"jpeg_photo_x{scale}"] = [corpus.photo_jpeg(t, scale=scale, seed=seed + i) for i, t in enumerate(texts)]
+    return sets, texts
+
+
+def _open(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data))
+
+
+def _stages(images: List[bytes], repeat: int) -> Dict[str, Any]:
+    loaded = [ocr.load_image(_open(d)) for d in images]
+    thresholded = [g.point(ocr._THRESHOLD_TABLE) for g in loaded]
+    n = len(images)
+
+    def each(fn: Callable[[Any], Any], inputs) -> Callable[[], None]:
+        return lambda: [fn(x) for x in inputs]
+
+    return {
+        "legacy.total": measure(each(lambda d: legacy_preprocess(_open(d)), images), repeat, ops=n),
+        "new.load": measure(each(lambda d: ocr.load_image(_open(d)), images), repeat, ops=n),
+        "new.threshold": measure(each(lambda g: g.point(ocr._THRESHOLD_TABLE), loaded), repeat, ops=n),
+        "new.autocrop": measure(each(ocr.autocrop, thresholded), repeat, ops=n),
+        "new.total": measure(each(lambda d: ocr.preprocess_image(_open(d)), images), repeat, ops=n),
+    }
+
+
+def _area(images: List[bytes], preprocess: Callable[[Image.Image], Image.Image]) -> int:
+    return sum(img.width * img.height for img in (preprocess(_open(d)) for d in images))
+
+
+def _pixels(images: List[bytes]) -> Dict[str, int]:
+    """Pixels handed to OCR by each pipeline."""
+    return {"legacy_pixels": _area(images, legacy_preprocess), "new_pixels": _area(images, ocr.preprocess_image)}
+
+
+def _similarity(recognised: str, expected: str) -> float:
+    # Whitespace differences are layout, not recognition errors
+    return difflib.SequenceMatcher(None, " ".join(recognised.split()), " ".join(expected.split())).ratio()
+
+
+def _accuracy(images: List[bytes], texts: List[str]) -> Dict[str, Any]:
+    engine = ocr.get_engine()
+    if not engine.healthy():
+        return skipped("Tesseract is not available")
+    legacy = [_similarity(engine.image_to_string(legacy_preprocess(_open(d))), t) for d, t in zip(images, texts)]
+    new = [_similarity(engine.image_to_string(ocr.preprocess_image(_open(d))), t) for d, t in zip(images, texts)]
+    return {
+        "engine": engine.name,
+        "legacy_similarity": round(sum(legacy) / len(legacy), 4),
+        "new_similarity": round(sum(new) / len(new), 4),
+    }
+
+
+def run(files: int = 10, repeat: int = 5, seed: int = 0) -> Dict[str, Any]:
+    sets, texts = reference_corpus(files, seed)
+    results = {}
+    for name, images in sets.items():
+        for stage, result in _stages(images, repeat).items():
+            results[f"preprocess.{name}.{stage}"] = result
+        results[f"preprocess.{name}.area"] = _pixels(images)
+        results[f"preprocess.{name}.accuracy"] = _accuracy(images, texts)
+    return results
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--files", type=int, default=10)
+    cli.add_argument("--repeat", type=int, default=5)
+    cli.add_argument("--seed", type=int, default=0)
+    args = cli.parse_args()
+    print(json.dumps(run(args.files, args.repeat, args.seed), indent=2, sort_keys=True))
@@ -0,0 +1,135 @@
+"""Sustained upload-insert throughput with concurrent readers.
+
+    python -m benchmarks.bench_writes --mode tuned|legacy [--records 2000] [--producers 8]
+                                      [--readers 2] [--seed 0] [--db-dir DIR]
+
+*legacy* reproduces the old storage layer: rollback journal with
+synchronous=FULL, and every producer thread saving and committing its own
+upload.  *tuned* uses the defaults (WAL, synchronous=NORMAL) and sends every
+upload through the group-commit writer.  In both modes reader threads keep
+running the transaction list and stats queries until the writes finish.
+
+The SQLite settings are read when the backend is imported, so each mode runs
+in its own process (benchmarks.run starts one per mode).  Prints one JSON
+object on stdout.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from benchmarks import corpus
+from benchmarks.bench_api import DEFAULT_DB_DIR
+
+MODES = ("legacy", "tuned")
+LEGACY_ENV = {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL"}
+
+
+def _records(n: int, seed: int):
+    return [
+        {
+            "filename": f"bench-{r['number']}.txt",
+            "content_hash": f"{seed:08x}{r['number']:056x}",
+            "parsed": {"vendor": r["vendor"], "date": r["date"], "amount": r["amount"],
+                       "category": r["category"], "currency": r["currency"]},
+            "line_items": [{"item": name, "price": price} for name, price in r["items"]],
+        }
+        for r in corpus.receipts(n, seed)
+    ]
+
+
+def run(mode: str, records: int = 2000, producers: int = 8, readers: int = 2, seed: int = 0,
+        db_dir: str = DEFAULT_DB_DIR):
+    os.makedirs(db_dir, exist_ok=True)
+    work = tempfile.mkdtemp(prefix=f"writes_{mode}_", dir=db_dir)
+    os.environ["RECEIPT_DB_PATH"] = os.path.join(work, "bench.db")
+    os.environ["RECEIPT_STORE_DIR"] = os.path.join(work, "store")
+    if mode == "legacy":
+        os.environ.update(LEGACY_ENV)
+
+    from backend.db import SessionLocal, Transaction
+    from backend.pipeline import save
+    from backend import writer
+
+    def write_legacy(r):
+        db = SessionLocal()
+        try:
+            save(db, r["filename"], r["parsed"], r["line_items"], r["content_hash"])
+        finally:
+            db.close()
+
+    def write_tuned(r):
+        writer.submit(r["filename"], r["content_hash"], r["parsed"], r["line_items"]).result()
+
+    write = write_legacy if mode == "legacy" else write_tuned
+    pending = _records(records, seed)
+    pending_lock = threading.Lock()
+    latencies, reads = [], []
+    done = threading.Event()
+
+    def producer():
+        while True:
+            with pending_lock:
+                if not pending:
+                    return
+                r = pending.pop()
+            start = time.perf_counter()
+            write(r)
+            latencies.append(time.perf_counter() - start)
+
+    def reader():
+        count = 0
+        while not done.is_set():
+            db = SessionLocal()
+            try:
+                db.query(Transaction).order_by(Transaction.id.desc()).limit(100).all()
+                db.query(Transaction.category, Transaction.amount).filter(Transaction.vendor == "Walmart").all()
+            finally:
+                db.close()
+            count += 1
+        reads.append(count)
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    producer_threads = [threading.Thread(target=producer) for _ in range(producers)]
+    for t in reader_threads:
+        t.start()
+    started = time.perf_counter()
+    for t in producer_threads:
+        t.start()
+    for t in producer_threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    for t in reader_threads:
+        t.join()
+    writer.shutdown()
+
+    latencies.sort()
+    return {
+        f"writes.{mode}": {
+            "median_s": round(elapsed, 6),
+            "records": records,
+            "producers": producers,
+            "readers": readers,
+            "inserts_per_s": round(records / elapsed, 1),
+            "reads_per_s": round(sum(reads) / elapsed, 1),
+            "write_p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "write_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 3),
+        }
+    }
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--mode", choices=MODES, required=True)
+    cli.add_argument("--records", type=int, default=2000)
+    cli.add_argument("--producers", type=int, default=8)
+    cli.add_argument("--readers", type=int, default=2)
+    cli.add_argument("--seed", type=int, default=0)
+    cli.add_argument("--db-dir", default=DEFAULT_DB_DIR)
+    args = cli.parse_args()
+    print(json.dumps(run(args.mode, args.records, args.producers, args.readers, args.seed, args.db_dir)))
+    sys.stdout.flush()
@@ -0,0 +1,161 @@
+"""Deterministic synthetic receipts for the benchmarks.
+
+Every generator takes a seed, so the same arguments always give byte-for-byte
+the same corpus.  A receipt can be rendered as plain text, a PNG, a PDF with a
+text layer or an image-only PDF (what a scanner produces).
+"""
+import io
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List
+from PIL import Image, ImageDraw, ImageFont
+from backend.parser import VENDOR_CATEGORY_MAP
+
+FIRST_DAY = date(2023, 1, 1)
+DAYS = (date(2025, 6, 30) - FIRST_DAY).days
+
+# Typical bill size per category (median, spread), roughly lognormal
+AMOUNT_PROFILES = {
+    "Electricity": (1800.0, 0.6),
+    "Internet": (799.0, 0.3),
+    "Groceries": (45.0, 0.8),
+    "Retail": (60.0, 0.9),
+    "Online Shopping": (35.0, 1.0),
+    "Wholesale": (180.0, 0.7),
+}
+INDIAN_CATEGORIES = {"Electricity", "Internet"}
+ITEMS = {
+    "Electricity": ["Energy Charges", "Fixed Charges", "Fuel Adjustment", "Electricity Duty", "Meter Rent"],
+    "Internet": ["Monthly Plan", "Router Rental", "Static IP", "GST"],
+    "Groceries": ["Milk", "Bread", "Eggs", "Rice", "Apples", "Coffee", "Butter", "Pasta", "Tomatoes"],
+    "Retail": ["T-Shirt", "Lamp", "Towels", "Notebook", "Headphones", "Shoes"],
+    "Online Shopping": ["USB Cable", "Phone Case", "Kindle Book", "Batteries", "Shipping"],
+    "Wholesale": ["Paper Towels 12pk", "Detergent", "Water 24pk", "Olive Oil 3L", "Coffee Beans 2kg"],
+}
+DATE_FORMATS = ["%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d %b %Y", "%B %d, %Y"]
+VENDORS = sorted(VENDOR_CATEGORY_MAP)
+
+
+def _receipt(rnd: random.Random, number: int) -> Dict[str, Any]:
+    vendor = rnd.choice(VENDORS)
+    category = VENDOR_CATEGORY_MAP[vendor]
+    median, spread = AMOUNT_PROFILES[category]
+    n_items = rnd.randint(1, 6)
+    prices = [round(rnd.lognormvariate(0, spread) * median / n_items, 2) for _ in range(n_items)]
+    return {
+        "number": number,
+        "vendor": vendor,
+        "category": category,
+        "date": FIRST_DAY + timedelta(days=rnd.randrange(DAYS)),
+        "date_format": rnd.choice(DATE_FORMATS),
+        "currency": "INR" if category in INDIAN_CATEGORIES else "$",
+        "items": [(rnd.choice(ITEMS[category]), p) for p in prices],
+        "amount": round(sum(prices), 2),
+    }
+
+
+def receipts(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    return [_receipt(rnd, i) for i in range(n)]
+
+
+def receipt_text(receipt: Dict[str, Any]) -> str:
+    symbol = "Rs." if receipt["currency"] == "INR" else "$"
+    lines = [
+        receipt["vendor"].upper(),
+        "Customer Copy",
+        f"Date: {receipt['date'].strftime(receipt['date_format'])}",
+        f"Invoice No: {100000 + receipt['number']}",
+        "",
+    ]
+    lines += [f"{item} {price:.2f}" for item, price in receipt["items"]]
+    lines += [
+        "",
+        f"Total Amount: {symbol} {receipt['amount']:,.2f}",
+        f"Currency: {receipt['currency']}",
+        "Thank you!",
+    ]
+    return "\n".join(lines)
+
+
+def texts(n: int, seed: int = 0) -> List[str]:
+    return [receipt_text(r) for r in receipts(n, seed)]
+
+
+def render_image(text: str, font_size: int = 28) -> Image.Image:
+    font = ImageFont.load_default(size=font_size)
+    lines = text.splitlines()
+    line_height = int(font_size * 1.4)
+    width = 60 + int(font_size * 0.62 * max(len(line) for line in lines))
+    image = Image.new("L", (width, 60 + line_height * len(lines)), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((30, 30 + i * line_height), line, fill=0, font=font)
+    return image
+
+
+def render_png(text: str) -> bytes:
+    out = io.BytesIO()
+    render_image(text).save(out, format="PNG")
+    return out.getvalue()
+
+
+def photo_jpeg(text: str, scale: int = 4, border: int = 300, seed: int = 0) -> bytes:
+    """A phone-photo-like JPEG: the receipt enlarged, in colour, on a darker table."""
+    receipt = render_image(text)
+    receipt = receipt.resize((receipt.width * scale, receipt.height * scale), Image.Resampling.BICUBIC)
+    rnd = random.Random(seed)
+    table = tuple(rnd.randrange(40, 110) for _ in range(3))
+    photo = Image.new("RGB", (receipt.width + 2 * border, receipt.height + 2 * border), table)
+    photo.paste(receipt.convert("RGB"), (border + rnd.randrange(-border // 2, border // 2),
+                                         border + rnd.randrange(-border // 2, border // 2)))
+    out = io.BytesIO()
+    photo.save(out, format="JPEG", quality=90, dpi=(72, 72))
+    return out.getvalue()
+
+
+def image_pdf(text: str) -> bytes:
+    """A scanned-style PDF: one page holding only the rendered image."""
+    out = io.BytesIO()
+    render_image(text).save(out, format="PDF", resolution=200.0)
+    return out.getvalue()
+
+
+def _pdf_string(line: str) -> str:
+    line = line.encode("latin-1", "replace").decode("latin-1")
+    return "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def text_pdf(text: str) -> bytes:
+    """A one-page PDF whose text is a real (Helvetica) text layer."""
+    ops = ["BT", "/F1 11 Tf", "14 TL", "50 800 Td"]
+    ops += [f"{_pdf_string(line)} Tj T*" for line in text.splitlines()]
+    ops.append("ET")
+    content = "\n".join(ops).encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def transaction_rows(n: int, seed: int = 0, chunk_size: int = 10000) -> Iterator[List[Dict[str, Any]]]:
+    """Receipts as database rows, in chunks, without holding *n* of them in memory."""
+    rnd = random.Random(seed)
+    for start in range(0, n, chunk_size):
+        yield [_receipt(rnd, i) for i in range(start, min(n, start + chunk_size))]
@@ -0,0 +1,239 @@
+"""Runs the benchmark suite and compares it with a stored baseline.
+
+    python -m benchmarks.run [--suites parser,algorithms,ocr,preprocess,api,writes] [--sizes 1000,100000,1000000]
+                             [--records 10000] [--repeat 5] [--seed 0] [--out results.json]
+                             [--baseline benchmarks/baseline.json] [--tolerance 0.25] [--update-baseline]
+
+Results are written as JSON (to --out, or stdout).  Every timing whose median
+is more than *tolerance* slower than the baseline is reported as a regression
+and makes the command exit with status 1.  --update-baseline stores this run
+as the new baseline instead, leaving out skipped entries.
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from benchmarks import corpus
+from benchmarks.bench_api import DEFAULT_DB_DIR
+from benchmarks import bench_preprocess, bench_writes
+from benchmarks.timing import measure, skipped
+
+SUITES = ("parser", "algorithms", "ocr", "preprocess", "api", "writes")
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+OCR_FILES = 5
+
+
+def _log(message: str) -> None:
+    print(message, file=sys.stderr, flush=True)
+
+
+def bench_parser(records: int, seed: int, repeat: int) -> Dict[str, Any]:
+    from backend.parser import parse_receipt_text, extract_category, extract_line_items
+    texts = corpus.texts(records, seed)
+    vendors = [parse_receipt_text(t)["vendor"] for t in texts]
+    return {
+        "parser.parse_receipt_text": measure(lambda: [parse_receipt_text(t) for t in texts], repeat, ops=len(texts)),
+        "parser.extract_category": measure(lambda: [extract_category(v) for v in vendors], repeat, ops=len(vendors)),
+        "parser.extract_line_items": measure(lambda: [extract_line_items(t) for t in texts], repeat, ops=len(texts)),
+    }
+
+
+def bench_algorithms(records: int, seed: int, repeat: int) -> Dict[str, Any]:
+    from backend import algorithms
+    rows = [
+        {"id": r["number"] + 1, "vendor": r["vendor"], "date": r["date"], "amount": r["amount"],
+         "category": r["category"], "currency": r["currency"]}
+        for r in corpus.receipts(records, seed)
+    ]
+    monthly = algorithms.monthly_aggregation(rows, "date", "amount")
+    cases = {
+        "linear_search": lambda: algorithms.linear_search(rows, "mart", ["vendor", "category"]),
+        "hash_search": lambda: algorithms.hash_search(rows, "vendor", "Walmart"),
+        "range_search": lambda: algorithms.range_search(rows, "amount", 10, 100),
+        "pattern_search": lambda: algorithms.pattern_search(rows, "vendor", r"^(tata|jio|airtel)"),
+        "timsort": lambda: algorithms.timsort(rows, "amount", reverse=True),
+        "top_k": lambda: algorithms.top_k(rows, "amount", 100, reverse=True),
+        "quicksort": lambda: algorithms.quicksort(rows, "amount"),
+        "compute_aggregates": lambda: algorithms.compute_aggregates(rows, "amount"),
+        "frequency_distribution": lambda: algorithms.frequency_distribution(rows, "vendor"),
+        "monthly_aggregation": lambda: algorithms.monthly_aggregation(rows, "date", "amount"),
+        "sliding_window_aggregation": lambda: algorithms.sliding_window_aggregation(monthly, 3),
+    }
+    public = {name for name, fn in inspect.getmembers(algorithms, inspect.isfunction)
+              if fn.__module__ == algorithms.__name__ and not name.startswith("_")}
+    for name in sorted(public - set(cases)):
+        _log(f"warning: algorithms.{name} has no benchmark case")
+    results = {}
+    for name, fn in cases.items():
+        ops = len(monthly) if name == "sliding_window_aggregation" else len(rows)
+        results[f"algorithms.{name}"] = measure(fn, repeat, ops=ops)
+    return results
+
+
+def bench_ocr(seed: int, repeat: int) -> Dict[str, Any]:
+    from backend.ocr import extract_text
+    texts = corpus.texts(OCR_FILES, seed)
+    formats = {
+        "txt": (".txt", [t.encode() for t in texts]),
+        "png": (".png", [corpus.render_png(t) for t in texts]),
+        "pdf_text_layer": (".pdf", [corpus.text_pdf(t) for t in texts]),
+        "pdf_image_only": (".pdf", [corpus.image_pdf(t) for t in texts]),
+    }
+    results = {}
+    for name, (ext, files) in formats.items():
+        try:
+            results[f"ocr.extract_text.{name}"] = measure(
+                lambda: [extract_text(f, ext) for f in files], repeat, ops=len(files))
+        except Exception as e:
+            # Tesseract is an external binary and may not be installed
+            results[f"ocr.extract_text.{name}"] = skipped(f"failed: {e}")
+    return results
+
+
+def bench_api(sizes: List[int], seed: int, repeat: int, db_dir: str) -> Dict[str, Any]:
+    results = {}
+    for rows in sizes:
+        _log(f"api: {rows} rows")
+        # One process per size: the database path is fixed when the backend is imported
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_api", "--rows", str(rows), "--seed", str(seed),
+             "--repeat", str(repeat), "--db-dir", db_dir],
+            stdout=subprocess.PIPE, text=True,
+        )
+        if proc.returncode != 0:
+            results[f"api.{rows}"] = skipped(f"bench_api exited with {proc.returncode}")
+            continue
+        results.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def bench_write_modes(seed: int, db_dir: str) -> Dict[str, Any]:
+    results = {}
+    for mode in bench_writes.MODES:
+        _log(f"writes: {mode}")
+        # One process per mode: SQLite settings are fixed when the backend is imported
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_writes", "--mode", mode, "--seed", str(seed),
+             "--db-dir", db_dir],
+            stdout=subprocess.PIPE, text=True,
+        )
+        if proc.returncode != 0:
+            results[f"writes.{mode}"] = skipped(f"bench_writes exited with {proc.returncode}")
+            continue
+        results.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Dict[str, List]:
+    """Splits timings present in both runs into regressions and improvements."""
+    report = {"regressions": [], "improvements": [], "missing": []}
+    for name, base in baseline.get("results", {}).items():
+        current = results.get(name)
+        if current is None:
+            report["missing"].append(name)
+            continue
+        if "median_s" not in current or "median_s" not in base or base["median_s"] <= 0:
+            continue
+        ratio = current["median_s"] / base["median_s"]
+        entry = (name, base["median_s"], current["median_s"], round(ratio, 2))
+        if ratio > 1 + tolerance:
+            report["regressions"].append(entry)
+        elif ratio < 1 - tolerance:
+            report["improvements"].append(entry)
+    return report
+
+
+def main() -> int:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--suites", default=",".join(SUITES))
+    cli.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    cli.add_argument("--records", type=int, default=10000, help="in-memory corpus size for parser/algorithms")
+    cli.add_argument("--repeat", type=int, default=5)
+    cli.add_argument("--seed", type=int, default=0)
+    cli.add_argument("--db-dir", default=DEFAULT_DB_DIR, help="where seeded databases are cached")
+    cli.add_argument("--out")
+    cli.add_argument("--baseline", default=DEFAULT_BASELINE)
+    cli.add_argument("--tolerance", type=float, default=0.25)
+    cli.add_argument("--update-baseline", action="store_true")
+    args = cli.parse_args()
+
+    suites = [s for s in args.suites.split(",") if s]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        cli.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    results = {}
+    if "parser" in suites:
+        _log("parser")
+        results.update(bench_parser(args.records, args.seed, args.repeat))
+    if "algorithms" in suites:
+        _log("algorithms")
+        results.update(bench_algorithms(args.records, args.seed, args.repeat))
+    if "ocr" in suites:
+        _log("ocr")
+        results.update(bench_ocr(args.seed, args.repeat))
+    if "preprocess" in suites:
+        _log("preprocess")
+        results.update(bench_preprocess.run(repeat=args.repeat, seed=args.seed))
+    if "api" in suites:
+        sizes = [int(s) for s in args.sizes.split(",") if s]
+        results.update(bench_api(sizes, args.seed, args.repeat, args.db_dir))
+    if "writes" in suites:
+        results.update(bench_write_modes(args.seed, args.db_dir))
+
+    run = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "records": args.records,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output = json.dumps(run, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.update_baseline:
+        # Skipped entries hold no timing to compare, only why this machine
+        # could not run them, so they stay out of the baseline
+        stored = dict(run, results={k: v for k, v in results.items() if "skipped" not in v})
+        with open(args.baseline, "w") as f:
+            f.write(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        _log(f"baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        _log("no baseline to compare with")
+        return 0
+    with open(args.baseline) as f:
+        report = compare(results, json.load(f), args.tolerance)
+    for label in ("regressions", "improvements"):
+        for name, base, current, ratio in report[label]:
+            _log(f"{label[:-1]}: {name} {base:.6f}s -> {current:.6f}s (x{ratio})")
+    _log(f"{len(report['regressions'])} regressions, {len(report['improvements'])} improvements "
+         f"(tolerance {args.tolerance:.0%})")
+    return 1 if report["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+import statistics
+import time
+from typing import Any, Callable, Dict
+
+
+def measure(fn: Callable[[], Any], repeat: int = 5, warmup: int = 1, ops: int = 1) -> Dict[str, Any]:
+    """Times *repeat* calls of *fn* after *warmup* untimed ones.
+
+    *ops* is how many operations one call performs (e.g. receipts parsed), so
+    results also carry a per-operation figure.
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "median_s": round(median, 6),
+        "min_s": round(min(times), 6),
+        "max_s": round(max(times), 6),
+        "repeat": repeat,
+        "ops": ops,
+        "per_op_us": round(median / ops * 1e6, 3),
+    }
+
+
+def skipped(reason: str) -> Dict[str, Any]:
+    return {"skipped": reason}
@@ -1,3 +1,4 @@
+import time
 import streamlit as st
 import requests
 import pandas as pd
@@ -5,6 +6,86 @@ import altair as alt
 from collections import Counter
 
 API_URL = "http://localhost:9000"
+# The sorted table shows only the newest rows
+TABLE_ROWS = 500
+CHANGES_PAGE_SIZE = 5000
+LEDGER_COLUMNS = ["id", "receipt_id", "vendor", "date", "amount", "category", "currency"]
+
+
+@st.cache_resource
+def _http():
+    # One keep-alive connection pool for every rerun
+    return requests.Session()
+
+
+def get_json(path, params=None):
+    """GET *path*, revalidating the copy kept from an earlier rerun.
+
+    Read endpoints tag responses with the data version as an ETag; sending it
+    back as If-None-Match gets a bodiless 304 while nothing has changed, and
+    the cached body is reused.  Returns (status_code, body).
+    """
+    cache = st.session_state.setdefault("etag_cache", {})
+    url = requests.Request("GET", f"{API_URL}{path}", params=params).prepare().url
+    cached = cache.get(url)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    resp = _http().get(url, headers=headers, timeout=30)
+    if resp.status_code == 304 and cached:
+        return 200, cached[1]
+    if resp.status_code != 200:
+        return resp.status_code, None
+    body = resp.json()
+    if resp.headers.get("ETag"):
+        cache[url] = (resp.headers["ETag"], body)
+    return 200, body
+
+def _apply_changes(state, rows):
+    """Upserts changed rows into the session ledger and moves their counts."""
+    delta = pd.DataFrame(rows, columns=LEDGER_COLUMNS).set_index("id")
+    ledger = state.ledger
+    changed = delta.index.intersection(ledger.index)
+    if len(changed):
+        old = ledger.loc[changed]
+        state.vendor_counts.subtract(old["vendor"].dropna())
+        state.category_counts.subtract(old["category"].dropna())
+        ledger = ledger.drop(changed)
+    state.vendor_counts.update(delta["vendor"].dropna())
+    state.category_counts.update(delta["category"].dropna())
+    ledger = pd.concat([ledger, delta]) if len(ledger) else delta
+    state.ledger = ledger.sort_index() if len(changed) else ledger
+
+
+def sync_ledger():
+    """Brings the session's copy of the transactions up to date.
+
+    The first run pages through the whole table; later reruns ask the change
+    feed only for rows inserted or changed since the version they last saw,
+    and fold those into the DataFrame and the vendor/category counters.
+    Returns False if the backend could not be reached.
+    """
+    state = st.session_state
+    if "ledger" not in state:
+        state.ledger = pd.DataFrame(columns=LEDGER_COLUMNS).set_index("id")
+        state.vendor_counts = Counter()
+        state.category_counts = Counter()
+        state.ledger_version = None
+    while True:
+        params = {"limit": CHANGES_PAGE_SIZE}
+        if state.ledger_version is not None:
+            params["since"] = state.ledger_version
+        try:
+            resp = _http().get(f"{API_URL}/transactions/changes", params=params, timeout=30)
+        except requests.exceptions.RequestException:
+            return False
+        if resp.status_code != 200:
+            return False
+        body = resp.json()
+        if body["transactions"]:
+            _apply_changes(state, body["transactions"])
+        state.ledger_version = body["version"]
+        if not body["has_more"]:
+            return True
+
 
 st.set_page_config(page_title="IntellijAnalyzer Dashboard", layout="wide")
 st.title("Intelligent Receipt and Bill Analyzer")
@@ -21,7 +102,20 @@ if uploaded_file:
     try:
         with st.spinner("Uploading and processing..."):
             resp = requests.post(f"{API_URL}/upload/", files=files, timeout=120)
-        if resp.status_code == 200:
+            # The backend queues OCR and returns a job id; poll until it finishes
+            if resp.status_code == 202:
+                job_id = resp.json()["job_id"]
+                deadline = time.monotonic() + 120
+                while True:
+                    resp = requests.get(f"{API_URL}/jobs/{job_id}/result", timeout=10)
+                    if resp.status_code != 202:
+                        break
+                    if time.monotonic() > deadline:
+                        raise requests.exceptions.Timeout()
+                    time.sleep(0.5)
+        if resp.status_code == 200 and resp.json().get("duplicate"):
+            st.info("This file was already uploaded; showing the stored result.")
+        elif resp.status_code == 200:
             st.success("File uploaded and processed successfully!")
         else:
             try:
@@ -36,13 +130,11 @@ if uploaded_file:
 
 
 st.header("Uploaded Receipts and Bills")
-receipts_resp = requests.get(f"{API_URL}/transactions/")
-receipts_data = []
-if receipts_resp.status_code == 200:
-    receipts_data = receipts_resp.json().get("transactions", [])
-    if receipts_data:
-        receipts_df = pd.DataFrame(receipts_data)
-        st.dataframe(receipts_df)
+synced = sync_ledger()
+ledger = st.session_state.ledger
+if synced:
+    if len(ledger):
+        st.dataframe(ledger.reset_index())
     else:
         st.info("No receipts uploaded yet.")
 else:
@@ -50,30 +142,28 @@ else:
 
 
 st.header("Tabular View: Parsed Transactions")
-trans_resp = requests.get(f"{API_URL}/transactions/sorted/?sort_by=date&order=desc")
-data = []
-if trans_resp.status_code == 200:
-    data = trans_resp.json().get("transactions", [])
-    if data:
-        df = pd.DataFrame(data)
-        st.dataframe(df)
+if synced:
+    if len(ledger):
+        # Newest first, undated rows last, ties by id: the backend's sort order
+        newest = ledger.reset_index().sort_values("id").sort_values(
+            "date", ascending=False, na_position="last", kind="stable")
+        st.dataframe(newest.head(TABLE_ROWS))
     else:
         st.info("No transactions found.")
 else:
     st.error("Failed to fetch transactions from backend.")
-    data = []
 
 
 st.header("Statistical Visualizations")
 
-if data:
-    vendor_freq = Counter([t['vendor'] for t in data if t.get('vendor')])
+vendor_freq = +st.session_state.vendor_counts
+cat_freq = +st.session_state.category_counts
+if vendor_freq or cat_freq:
     if vendor_freq:
         st.subheader("Vendor Frequency Distribution (Bar Chart)")
         vendor_df = pd.DataFrame(list(vendor_freq.items()), columns=["Vendor", "Count"])
         st.bar_chart(vendor_df.set_index("Vendor"))
  
-    cat_freq = Counter([t['category'] for t in data if t.get('category')])
     if cat_freq:
         st.subheader("Category Distribution (Pie Chart)")
         cat_df = pd.DataFrame(list(cat_freq.items()), columns=["Category", "Count"])
@@ -88,9 +178,8 @@ else:
 
 
 st.header("Time-Series Expenditure Trend")
-stats_resp = requests.get(f"{API_URL}/transactions/stats/")
-if stats_resp.status_code == 200:
-    stats = stats_resp.json()
+stats_status, stats = get_json("/transactions/stats/")
+if stats_status == 200:
     monthly = stats.get("monthly_totals", {})
     moving_avg = stats.get("monthly_moving_avg", {})
     if monthly: